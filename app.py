@@ -1,38 +1,51 @@
-from models import db, User, Message, Order, OrderItem, MoreDetail, Service
-from flask import Flask, request, jsonify, make_response
+from models import db, User, Message, MessageArchive, Order, OrderItem, MoreDetail, Service, Job, Conversation
+from flask import Flask, request, jsonify, make_response, Response, stream_with_context, current_app, send_from_directory
+from flask.cli import with_appcontext
+from functools import wraps
+import click
 from flask_migrate import Migrate
 from flask_restful import Api, Resource
 from datetime import datetime
+from math import isfinite
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_jwt_extended import create_access_token, JWTManager, create_refresh_token, get_jwt_identity, jwt_required
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
-
-app = Flask(__name__)
-
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get('DATABASE_URI')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db.init_app(app)
-
-migrate = Migrate(app, db)
-
-CORS(app, supports_credentials=True)
-
-api = Api(app)
-
-app.secret_key = os.getenv('FLASK_SECRET_KEY', 'default_secret_key')
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'default_jwt_secret_key')
+from sqlalchemy import select
+from config import get_config
+from geo import get_provider_index, normalize_location, parse_point, MAX_RADIUS_KM
+from serializers import USER_SCHEMA, MESSAGE_SCHEMA, MESSAGE_ARCHIVE_SCHEMA, CONVERSATION_SCHEMA, json_response
+from inbox import mark_read, rebuild_conversations
+from exports import export_chunks, check_export, FORMATS
+from archive import archive_messages, ensure_message_partitions
+from write_buffer import message_buffer
+from ratelimit import limiter
+from jobs import enqueue, Worker
+from profiling import profiler
+import chat  # registers the chat_reply job handler
+
+# Extensions are created here and bound to an app in create_app()
+migrate = Migrate()
+cors = CORS()
+jwt = JWTManager()
+api = Api()
+
+# Only lets through logged in users listed in the ADMIN_USERNAMES setting
+def admin_required(func):
+    @wraps(func)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        user = db.session.get(User, get_jwt_identity())
 
-jwt = JWTManager(app)
+        if not user or user.username not in current_app.config['ADMIN_USERNAMES']:
+            return {"error": "Admin access required"}, 403
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return func(*args, **kwargs)
+    return wrapper
 
 # This class represents an API endpoint `/register`, which handles user registration. It extends `Resource`, so it can respond to HTTP methods like `POST`.
 class UserRegister(Resource):
+    @limiter.limit("register", "10/hour")
     def post(self):
         data = request.get_json()
 
@@ -45,6 +58,10 @@ class UserRegister(Resource):
         password = data.get('password')
         role = data.get('role')
 
+        # Admin access is granted from the server config only, so nobody can sign up as one
+        if role and str(role).strip().lower() == 'admin':
+            return {'error': 'Invalid role'}, 400
+
         # Convert date string to Python date object
         try:
             date_str = data.get('date_of_birth')
@@ -86,6 +103,7 @@ api.add_resource(UserRegister, "/register")
 
 # This class represents an Api endpoint "/login" for loging in.
 class UserLogin(Resource):
+    @limiter.limit("login", "5/minute")
     def post(self):
 
         data = request.get_json()
@@ -155,8 +173,51 @@ api.add_resource(CheckSession, '/check_session')
 
 class ServiceProviders(Resource):
     def get(self):
-        users = User.query.filter_by(role='Worker').all()
-        return [user.to_dict() for user in users], 200
+        near = request.args.get('near')
+
+        # ?fields=id,display_name,more_details.jobTitle picks the columns to return
+        try:
+            fields = USER_SCHEMA.parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        if not near:
+            return json_response(USER_SCHEMA.dump(User.role == 'Worker', fields=fields, order_by=User.id))
+
+        # `near` is either "lat,lng" or a known town name, `radius` is in kilometres
+        point = parse_point(near)
+        if not point:
+            return {"error": "Invalid near parameter. Expected lat,lng or a known location"}, 400
+
+        try:
+            radius = float(request.args.get('radius', 25))
+        except ValueError:
+            radius = None
+
+        # float() also accepts inf and nan, which the grid can't turn into cells
+        if radius is None or not isfinite(radius) or not 0 < radius <= MAX_RADIUS_KM:
+            return {"error": f"Invalid radius. Expected a number of kilometres between 0 and {MAX_RADIUS_KM:g}"}, 400
+
+        nearest = get_provider_index().nearest(point[0], point[1], radius)
+
+        # The id is needed to put the rows back in distance order
+        with_id = "id" in fields
+        fields.setdefault("id", None)
+        users = {
+            user["id"]: user
+            for user in USER_SCHEMA.dump(User.id.in_([user_id for user_id, _ in nearest]), User.role == 'Worker', fields=fields)
+        }
+
+        providers = []
+        for user_id, distance in nearest:
+            provider = users.get(user_id)
+            if provider:
+                if not with_id:
+                    del provider["id"]
+                provider["distance_km"] = round(distance, 2)
+                providers.append(provider)
+
+        return json_response(providers)
 
 api.add_resource(ServiceProviders, '/serviceproviders')
 
@@ -178,13 +239,19 @@ class UserDetails(Resource):
         jobTitle =  data.get("jobTitle")
         description = data.get("description")
         detailedDescription = data.get("detailedDescription")
-        payRate = data.get("payRate"),
+        payRate = data.get("payRate")
         completionRate = data.get("completionRate")
         rating = data.get("rating")
         location = data.get("location")
         responseTime = data.get("responseTime")
         user_id = get_jwt_identity()
 
+        # Use explicit coordinates when the client sends them, otherwise look the location up
+        latitude = data.get("latitude")
+        longitude = data.get("longitude")
+        if latitude is None or longitude is None:
+            latitude, longitude = normalize_location(location) or (None, None)
+
         new_details = MoreDetail(
             category = category,
             jobTitle = jobTitle,
@@ -194,6 +261,8 @@ class UserDetails(Resource):
             completionRate = completionRate,
             rating = rating,
             location = location,
+            latitude = latitude,
+            longitude = longitude,
             responseTime = responseTime,
             user_id = user_id
         )
@@ -203,28 +272,35 @@ class UserDetails(Resource):
             db.session.commit()
         except Exception as e:
             db.session.rollback()
-            return jsonify({"Error":str(e)}), 200
+            return {"Error":str(e)}, 500
+
+        get_provider_index().update(new_details.user_id, new_details.latitude, new_details.longitude)
         
-        return jsonify({"Message": "Details Posted Successfully"}), 200
+        return {"Message": "Details Posted Successfully"}, 200
     
     def patch(self, id):
 
-        detail = MoreDetail.query.filter_by(user_id=id)
+        detail = MoreDetail.query.filter_by(user_id=id).first()
 
         if not detail:
-            return jsonify({'error': 'Detail not found'}), 404
+            return {'error': 'Detail not found'}, 404
 
         data = request.get_json()
 
         for key, value in data.items():
             setattr(detail, key, value)
+
+        # Keep the coordinates in step with a changed location
+        if "location" in data and ("latitude" not in data or "longitude" not in data):
+            detail.latitude, detail.longitude = normalize_location(detail.location) or (None, None)
         
         try:
             db.session.commit()
-            return jsonify(detail.to_dict()), 200  # Return updated address details
+            get_provider_index().update(detail.user_id, detail.latitude, detail.longitude)
+            return detail.to_dict(), 200  # Return updated address details
         except Exception as e:
             db.session.rollback()
-            return jsonify({'error': f'Failed to update details: {str(e)}'}), 500
+            return {'error': f'Failed to update details: {str(e)}'}, 500
         
 
 api.add_resource(UserDetails, "/details", "/details/<int:id>")
@@ -274,6 +350,7 @@ class UserServices(Resource):
 api.add_resource(UserServices, "/services" ,"/service/<int:id>")
 
 class SendMessage(Resource):
+    @limiter.limit("send_message", "60/minute")
     @jwt_required()
     def post(self):
 
@@ -283,24 +360,19 @@ class SendMessage(Resource):
         receiver = data.get("receiver")
         sender = get_jwt_identity()
 
-        new_message = Message(
-            message = message,
-            receiver = receiver,
-            sender = sender
-        )
-
         try:
-            db.session.add(new_message)
-            db.session.commit()
+            new_message = message_buffer.write(message=message, sender=sender, receiver=receiver)
         except Exception as e:
-            db.session.rollback()
             return {"error":str(e)}, 500
         
-        return new_message.to_dict(), 200
+        return new_message, 200
     
 api.add_resource(SendMessage, '/messages/send')
 
+# Saves the client's message and queues the provider's AI reply for `flask worker`.
+# Returns 202 with a job id; the reply is available from /jobs/<job_id> once the job is done.
 class ChatSend(Resource):
+    @limiter.limit("chat_send", "10/minute")
     @jwt_required()
     def post(self):
         data = request.get_json()
@@ -313,13 +385,7 @@ class ChatSend(Resource):
 
         try:
             # 1. Save user message
-            user_msg_obj = Message(
-                message=user_message,
-                sender=sender_id,
-                receiver=receivers_id
-            )
-            db.session.add(user_msg_obj)
-            db.session.commit()
+            user_msg = message_buffer.write(message=user_message, sender=sender_id, receiver=receivers_id)
 
             user = User.query.filter_by(id=receivers_id).first()
             detail = MoreDetail.query.filter_by(user_id=receivers_id).first()
@@ -327,41 +393,18 @@ class ChatSend(Resource):
             if not user or not detail:
                 return {"error": "Receiver not found or missing details."}, 404
 
-            system_prompt = (
-                f"You are {user.display_name}, a professional {detail.jobTitle}. "
-                "You represent a trusted service provider on a client-focused platform. "
-                "You help clients by answering questions, providing service details, and responding professionally. "
-                "Stay focused on your area of expertise and avoid behaving like a general-purpose chatbot. "
-                "Respond clearly, respectfully, and knowledgeably as a human expert in your field."
-                "Break down the services one by one with their respective prices. "
-                "Always calculate and present the total at the end. "
-                "If you're unsure about a price, provide an estimate."
-            )
-
-            # 2. Call OpenAI with stored user message
-            response = client.chat.completions.create(
-                model=("gpt-4o-mini"),
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-            )
-            ai_message_text = response.choices[0].message.content
+            # 2. Queue the AI reply
+            job = enqueue("chat_reply", {
+                "sender_id": sender_id,
+                "receiver_id": receivers_id,
+                "message": user_message
+            }, user_id=sender_id, max_attempts=current_app.config['JOB_MAX_ATTEMPTS'])
 
-            # 3. Save AI response
-            ai_msg_obj = Message(
-                message=ai_message_text,
-                sender=receivers_id,  # AI "sender" could be receiver_id or a special bot user ID
-                receiver=sender_id
-            )
-            db.session.add(ai_msg_obj)
-            db.session.commit()
-
-            # 4. Return both messages or just AI message
             return {
-                "user_message": user_msg_obj.to_dict(),
-                "ai_response": ai_msg_obj.to_dict()
-            }, 200
+                "user_message": user_msg,
+                "job_id": job.id,
+                "status_url": f"/jobs/{job.id}"
+            }, 202
 
         except Exception as e:
             db.session.rollback()
@@ -369,32 +412,117 @@ class ChatSend(Resource):
 
 api.add_resource(ChatSend, "/chat/send")
 
+# Lets the client poll a job it started, e.g. the AI reply queued by /chat/send
+class JobStatus(Resource):
+    @jwt_required()
+    def get(self, id):
+        job = db.session.get(Job, id)
+
+        if not job or str(job.user_id) != str(get_jwt_identity()):
+            return {"error": "Job not found"}, 404
+
+        return job.to_dict(), 200
+
+api.add_resource(JobStatus, "/jobs/<int:id>")
+
+# Without paging parameters this returns the whole conversation, archived messages included.
+# With ?limit= (and ?before=<message id> to scroll further back) it returns one page, oldest first,
+# and only reads the archive once the live messages table has run out of older messages.
 class GetMessages(Resource):
     @jwt_required()
     def get(self):
         current_user_id = get_jwt_identity()
         other_user_id = request.args.get('user_id')
+        before = request.args.get('before', type=int)
+        limit = request.args.get('limit', type=int)
+
+        # receiver_name is not a column, so it is handled here rather than by the schema
+        requested = request.args.get('fields')
+        wanted = requested.split(",") if requested else ["id", "sender", "receiver", "message", "receiver_name", "timestamp"]
 
-        messages = Message.query.filter(
-            ((Message.sender == current_user_id) & (Message.receiver == other_user_id)) |
-            ((Message.sender == other_user_id) & (Message.receiver == current_user_id))
-        ).order_by(Message.timestamp.asc()).all()
+        columns = [name for name in wanted if name.strip() != "receiver_name"]
 
-        user = User.query.filter_by(id=other_user_id).first()
+        # Asking only for receiver_name selects no columns at all, rather than falling back to the defaults
+        try:
+            fields = MESSAGE_SCHEMA.parse_fields(columns) if columns else {}
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        def conversation(model):
+            return (
+                ((model.sender == current_user_id) & (model.receiver == other_user_id)) |
+                ((model.sender == other_user_id) & (model.receiver == current_user_id))
+            )
+
+        if before is None and limit is None:
+            # The whole history: archived messages are all older than the live ones, so they come first
+            messages = MESSAGE_ARCHIVE_SCHEMA.dump(
+                conversation(MessageArchive), fields=fields, order_by=MessageArchive.timestamp.asc()
+            )
+            messages += MESSAGE_SCHEMA.dump(conversation(Message), fields=fields, order_by=Message.timestamp.asc())
+        else:
+            limit = max(1, min(limit or 50, 500))
+
+            criteria = [conversation(Message)]
+            if before is not None:
+                criteria.append(Message.id < before)
+            messages = MESSAGE_SCHEMA.dump(*criteria, fields=fields, order_by=Message.id.desc(), limit=limit)
 
-        message_list = [{
-            "id": m.id,
-            "sender": m.sender,
-            "receiver": m.receiver,
-            "message": m.message,
-            "receiver_name": user.display_name,
-            "timestamp": m.timestamp.isoformat()
-        } for m in messages]
+            # Archived messages are all older than the live ones, so they only matter once the live rows are exhausted
+            if len(messages) < limit:
+                criteria = [conversation(MessageArchive)]
+                if before is not None:
+                    criteria.append(MessageArchive.id < before)
+                messages += MESSAGE_ARCHIVE_SCHEMA.dump(
+                    *criteria, fields=fields, order_by=MessageArchive.id.desc(), limit=limit - len(messages)
+                )
 
-        return message_list, 200
+            messages.reverse()
+
+        if "receiver_name" in [name.strip() for name in wanted]:
+            receiver_name = db.session.scalar(select(User.display_name).where(User.id == other_user_id))
+            for message in messages:
+                message["receiver_name"] = receiver_name
+
+        return json_response(messages)
 
 api.add_resource(GetMessages, '/messages')
 
+# Lists the current user's conversations, most recent first, with the last message and unread count for each partner
+class Inbox(Resource):
+    @jwt_required()
+    def get(self):
+        user_id = get_jwt_identity()
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+
+        conversations = CONVERSATION_SCHEMA.dump(
+            Conversation.user_id == user_id,
+            Conversation.partner_id == User.id,
+            order_by=Conversation.last_timestamp.desc(),
+            limit=limit
+        )
+
+        return json_response(conversations)
+
+api.add_resource(Inbox, "/inbox")
+
+# Read receipt: resets the unread count of the conversation with `user_id`
+class InboxRead(Resource):
+    @jwt_required()
+    def post(self):
+        data = request.get_json() or {}
+        partner_id = data.get("user_id")
+
+        if not partner_id:
+            return {"error": "Missing user_id"}, 400
+
+        if not mark_read(get_jwt_identity(), partner_id):
+            return {"error": "Conversation not found"}, 404
+
+        return {"user_id": partner_id, "unread_count": 0}, 200
+
+api.add_resource(InboxRead, "/inbox/read")
+
 class UserOrder(Resource):
     @jwt_required()
     def post(self):
@@ -443,5 +571,162 @@ class UserOrder(Resource):
 
 api.add_resource(UserOrder, '/order', "/order/<int:id>")
 
+# Streams every row of messages, orders or order_items for the analytics pipelines.
+# Pass ?after_id= with the last id received to resume, and ?since= (ISO timestamp, messages only) to skip old rows.
+class AdminExport(Resource):
+    @admin_required
+    def get(self, table):
+        format = request.args.get("format", "ndjson")
+
+        # A bad after_id must not quietly restart a resumed export from the first row
+        after_id = request.args.get("after_id")
+        if after_id is not None:
+            if not after_id.isdigit():
+                return {"error": "Invalid after_id. Expected the id of the last row received"}, 400
+            after_id = int(after_id)
+
+        try:
+            since = request.args.get("since")
+            since = datetime.fromisoformat(since) if since else None
+            check_export(table, format, since)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        chunks = export_chunks(table, format, after_id=after_id, since=since)
+        mimetype = "text/csv" if format == "csv" else "application/x-ndjson"
+
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename={table}.{format}"}
+        )
+
+api.add_resource(AdminExport, "/admin/export/<string:table>")
+
+# Shows how often each rate limit let requests through or throttled them in this process, and who was throttled most
+class AdminRateLimits(Resource):
+    @admin_required
+    def get(self):
+        return limiter.stats(), 200
+
+api.add_resource(AdminRateLimits, "/admin/ratelimits")
+
+# Turns request profiling on and off at runtime and lists the saved profiles.
+# PATCH {"enabled": true, "sample_rate": 0.01} changes the settings for every worker.
+# POST returns a signed token; requests sent with it in the X-Profile header are always profiled while profiling is enabled.
+class AdminProfiling(Resource):
+    @admin_required
+    def get(self):
+        return {"settings": profiler.settings(), "profiles": profiler.profiles()}, 200
+
+    @admin_required
+    def patch(self):
+        data = request.get_json() or {}
+
+        try:
+            settings = profiler.configure(enabled=data.get("enabled"), sample_rate=data.get("sample_rate"))
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}, 400
+
+        return settings, 200
+
+    @admin_required
+    def post(self):
+        return {
+            "header": profiler.header,
+            "token": profiler.issue_token(get_jwt_identity()),
+            "expires_in": profiler.token_max_age
+        }, 201
+
+api.add_resource(AdminProfiling, "/admin/profiling")
+
+# Downloads one saved profile, e.g. /admin/profiling/serviceproviders/20250101T120000000000-840ms.prof
+class AdminProfileFile(Resource):
+    @admin_required
+    def get(self, endpoint, filename):
+        return send_from_directory(profiler.output_dir, f"{endpoint}/{filename}", as_attachment=True)
+
+api.add_resource(AdminProfileFile, "/admin/profiling/<string:endpoint>/<string:filename>")
+
+@click.command("export")
+@click.argument("table")
+@click.option("--format", "format", type=click.Choice(FORMATS), default="ndjson", help="Output format.")
+@click.option("--after-id", type=int, help="Only export rows with an id greater than this.")
+@click.option("--since", type=click.DateTime(), help="Only export messages sent at or after this time.")
+@click.option("--batch-size", type=int, default=1000, help="Rows fetched per round trip.")
+@click.option("--output", "-o", type=click.File("wb"), default="-", help="File to write to, stdout by default.")
+@with_appcontext
+def export_command(table, format, after_id, since, batch_size, output):
+    """Stream messages, orders or order_items as NDJSON or CSV."""
+    try:
+        chunks = export_chunks(table, format, after_id=after_id, since=since, batch_size=batch_size)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    for chunk in chunks:
+        output.write(chunk)
+
+@click.command("archive-messages")
+@click.option("--days", type=int, help="Archive messages older than this many days. Defaults to MESSAGE_ARCHIVE_AFTER_DAYS.")
+@click.option("--batch-size", type=int, default=5000, help="Messages moved per transaction.")
+@with_appcontext
+def archive_messages_command(days, batch_size):
+    """Move old messages into the messages_archive table."""
+    days = days if days is not None else current_app.config['MESSAGE_ARCHIVE_AFTER_DAYS']
+
+    created = ensure_message_partitions()
+    if created:
+        click.echo(f"Created partitions: {', '.join(created)}")
+
+    archived = archive_messages(days, batch_size=batch_size)
+    click.echo(f"Archived {archived} messages older than {days} days")
+
+@click.command("rebuild-inbox")
+@with_appcontext
+def rebuild_inbox_command():
+    """Rebuild the conversations summary table from the messages table."""
+    count = rebuild_conversations()
+    click.echo(f"Rebuilt {count} conversation rows")
+
+@click.command("worker")
+@click.option("--concurrency", "-c", type=int, help="Jobs run at the same time. Defaults to JOB_WORKERS.")
+@with_appcontext
+def worker_command(concurrency):
+    """Run background jobs such as AI chat replies."""
+    worker = Worker(current_app._get_current_object(), concurrency)
+    click.echo(f"Worker {worker.name} running {worker.concurrency} threads")
+    worker.run()
+
+# Builds the app for `config` (a config class, or a name from config.configs; APP_ENV by default).
+# Used by `flask` (which finds create_app on its own), gunicorn ("app:create_app()") and seed.py.
+# Nothing here opens network connections; the OpenAI client is only created when a chat reply needs it.
+def create_app(config=None):
+    app = Flask(__name__)
+
+    if config is None or isinstance(config, str):
+        config = get_config(config)
+    app.config.from_object(config)
+
+    # Behind a load balancer every request comes from the proxy, so trust X-Forwarded-For from that many hops
+    if app.config.get('TRUSTED_PROXY_COUNT'):
+        count = app.config['TRUSTED_PROXY_COUNT']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=count, x_proto=count, x_host=count)
+
+    db.init_app(app)
+    migrate.init_app(app, db)
+    cors.init_app(app, supports_credentials=True)
+    jwt.init_app(app)
+    api.init_app(app)
+    message_buffer.init_app(app)
+    limiter.init_app(app)
+    profiler.init_app(app)
+
+    app.cli.add_command(export_command)
+    app.cli.add_command(archive_messages_command)
+    app.cli.add_command(worker_command)
+    app.cli.add_command(rebuild_inbox_command)
+
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, port=1737)
\ No newline at end of file
+    create_app().run(debug=True, port=1737)
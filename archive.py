@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+import re
+from sqlalchemy import select, insert, delete, literal, text
+from models import db, Message, MessageArchive
+
+# Monthly partitions created by the partitioning migration are named like messages_y2025m07
+PARTITION_NAME = re.compile(r"^messages_y(\d{4})m(\d{2})$")
+
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def _is_partitioned():
+    bind = db.session.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return False
+
+    return bool(db.session.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'messages'"
+    )).scalar())
+
+
+def _partitions():
+    names = db.session.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'messages'"
+    )).scalars()
+
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[name] = datetime(int(match.group(1)), int(match.group(2)), 1)
+    return partitions
+
+
+# Creates the monthly partitions for the coming months so new messages never land in the default partition.
+# Rows already sitting in messages_default for a month are moved into its new partition first, since PostgreSQL
+# refuses to add a partition whose range overlaps rows in the default one. Each month is done in its own transaction.
+# Does nothing unless the messages table has been partitioned (PostgreSQL only).
+def ensure_message_partitions(months_ahead=3):
+    if not _is_partitioned():
+        return []
+
+    existing = _partitions()
+    has_default = db.session.execute(text("SELECT to_regclass('messages_default') IS NOT NULL")).scalar()
+    created = []
+
+    month = _month_start(datetime.utcnow())
+    for _ in range(months_ahead + 1):
+        name = f"messages_y{month.year:04d}m{month.month:02d}"
+        bounds = f"FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+        in_range = f"timestamp >= '{month:%Y-%m-%d}' AND timestamp < '{_next_month(month):%Y-%m-%d}'"
+
+        if name not in existing:
+            try:
+                if has_default:
+                    # Blocks inserts into the default partition until the new partition is attached
+                    db.session.execute(text("LOCK TABLE messages_default IN ACCESS EXCLUSIVE MODE"))
+                    db.session.execute(text(
+                        f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                    ))
+                    db.session.execute(text(f"INSERT INTO {name} SELECT * FROM messages_default WHERE {in_range}"))
+                    db.session.execute(text(f"DELETE FROM messages_default WHERE {in_range}"))
+                    db.session.execute(text(f"ALTER TABLE messages ATTACH PARTITION {name} FOR VALUES {bounds}"))
+                else:
+                    db.session.execute(text(f"CREATE TABLE {name} PARTITION OF messages FOR VALUES {bounds}"))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            created.append(name)
+        month = _next_month(month)
+
+    return created
+
+
+# Moves messages older than `older_than_days` into messages_archive in batches, each batch in its own transaction.
+# On a partitioned table, monthly partitions that end before the cutoff are empty afterwards and are dropped.
+def archive_messages(older_than_days, batch_size=5000):
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    columns = ["id", "message", "receiver", "sender", "timestamp"]
+    archived = 0
+
+    while True:
+        ids = db.session.scalars(
+            select(Message.id).where(Message.timestamp < cutoff).order_by(Message.id).limit(batch_size)
+        ).all()
+
+        if not ids:
+            break
+
+        try:
+            db.session.execute(insert(MessageArchive).from_select(
+                columns + ["archived_at"],
+                select(*[getattr(Message, column) for column in columns], literal(datetime.utcnow()))
+                .where(Message.id.in_(ids), Message.timestamp < cutoff)
+            ))
+            db.session.execute(delete(Message).where(Message.id.in_(ids), Message.timestamp < cutoff))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        archived += len(ids)
+
+    if _is_partitioned():
+        for name, month in _partitions().items():
+            if _next_month(month) <= cutoff:
+                db.session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+        db.session.commit()
+
+    return archived
@@ -0,0 +1,89 @@
+# Compares the old to_dict() + json.dumps path with the column based serializers for the provider listing.
+#
+#   python benchmarks/bench_serialization.py            # 10k and 100k providers
+#   python benchmarks/bench_serialization.py 5000       # custom sizes
+#
+# The to_dict() path lazy loads four relationships per user, so at 100k providers it takes a long time to finish.
+#
+# In-memory SQLite, orjson:
+#
+#   providers  to_dict + json.dumps      schema      schema ?fields=
+#   10k               28652 ms           215 ms          42 ms
+#   100k            2194253 ms          2515 ms         530 ms
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, User, MoreDetail, Service
+from serializers import USER_SCHEMA, dumps, orjson
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    return app
+
+
+def seed(count):
+    db.session.execute(User.__table__.insert(), [
+        {"id": i, "first_name": "First", "last_name": f"Last{i}", "display_name": f"Worker {i}",
+         "email": f"worker{i}@example.com", "username": f"worker{i}", "password": "x" * 100, "role": "Worker"}
+        for i in range(1, count + 1)
+    ])
+    db.session.execute(MoreDetail.__table__.insert(), [
+        {"user_id": i, "category": "Home Services", "jobTitle": "Plumber", "description": "Fixes sinks",
+         "detailedDescription": "Lorem ipsum " * 20, "payRate": "$900", "completionRate": "95%",
+         "rating": "4.5", "location": "Nairobi", "responseTime": "2 hrs"}
+        for i in range(1, count + 1)
+    ])
+    db.session.execute(Service.__table__.insert(), [
+        {"user_id": i, "service": service}
+        for i in range(1, count + 1) for service in ("Fix Sink", "Install Lights")
+    ])
+    db.session.commit()
+
+
+def timed(label, func):
+    db.session.expire_all()
+    start = time.perf_counter()
+    body = func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {elapsed * 1000:10.1f} ms  {len(body) / 1024:10.0f} KiB")
+    db.session.remove()
+
+
+def to_dict_path():
+    users = User.query.filter_by(role='Worker').all()
+    return json.dumps([user.to_dict() for user in users]).encode("utf-8")
+
+
+def schema_path():
+    return dumps(USER_SCHEMA.dump(User.role == 'Worker', order_by=User.id))
+
+
+def schema_fields_path():
+    return dumps(USER_SCHEMA.dump(User.role == 'Worker', fields="id,display_name,more_details.jobTitle", order_by=User.id))
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or [10_000, 100_000]
+    print(f"JSON backend: {'orjson' if orjson else 'json'}")
+
+    for size in sizes:
+        app = make_app()
+        with app.app_context():
+            db.create_all()
+            seed(size)
+
+            print(f"{size} providers")
+            timed("to_dict + json.dumps", to_dict_path)
+            timed("schema", schema_path)
+            timed("schema ?fields=", schema_fields_path)
+
+            db.drop_all()
@@ -0,0 +1,38 @@
+# Measures how long a fresh process takes to import the app and build it with create_app(),
+# next to the cost of building the OpenAI client that used to happen at import time.
+#
+#   python benchmarks/bench_startup.py          # 10 runs of each
+#   python benchmarks/bench_startup.py 30
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = {
+    "create_app()": "from app import create_app; create_app('testing')",
+    "create_app() + OpenAI client": "from app import create_app; create_app('testing'); from openai import OpenAI; OpenAI(api_key='x')",
+    "python startup only": "pass",
+}
+
+CHECK = "import sys; from app import create_app; create_app('testing'); print('openai' in sys.modules)"
+
+
+def timed_run(code):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    for label, code in CASES.items():
+        timed_run(code)
+        times = [timed_run(code) for _ in range(runs)]
+        print(f"  {label:<32} {statistics.median(times) * 1000:8.0f} ms median of {runs}")
+
+    imported = subprocess.run([sys.executable, "-c", CHECK], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    print(f"  openai imported by create_app(): {imported}")
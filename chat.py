@@ -0,0 +1,91 @@
+from datetime import datetime
+from flask import current_app
+from models import db, User, MoreDetail, Message
+from jobs import job_handler
+from inbox import record_messages
+
+
+def build_system_prompt(user, detail):
+    return (
+        f"You are {user.display_name}, a professional {detail.jobTitle}. "
+        "You represent a trusted service provider on a client-focused platform. "
+        "You help clients by answering questions, providing service details, and responding professionally. "
+        "Stay focused on your area of expertise and avoid behaving like a general-purpose chatbot. "
+        "Respond clearly, respectfully, and knowledgeably as a human expert in your field."
+        "Break down the services one by one with their respective prices. "
+        "Always calculate and present the total at the end. "
+        "If you're unsure about a price, provide an estimate."
+    )
+
+
+# The chat completion client lives in app.extensions['llm'], so workers and tests can swap in a different one.
+# It is only created the first time a reply is generated, so the web app and CLI commands never build it.
+def get_llm_client():
+    client = current_app.extensions.get('llm')
+
+    if client is None:
+        from openai import OpenAI
+
+        client = OpenAI(api_key=current_app.config.get('OPENAI_API_KEY'))
+        current_app.extensions['llm'] = client
+
+    return client
+
+
+def generate_reply(system_prompt, user_message):
+    client = get_llm_client()
+
+    response = client.chat.completions.create(
+        model=current_app.config.get('OPENAI_MODEL', 'gpt-4o-mini'),
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ],
+    )
+    return response.choices[0].message.content
+
+
+# Runs in `flask worker`: asks the LLM to answer as the service provider and saves the answer as a message.
+# The reply and job.result are committed together, so a retry after a crash later on finds the saved reply
+# in job.result instead of writing it a second time.
+@job_handler("chat_reply")
+def chat_reply(job):
+    if job.result and "ai_response" in job.result:
+        return job.result
+
+    payload = job.payload
+    sender_id = payload["sender_id"]
+    receivers_id = payload["receiver_id"]
+
+    user = User.query.filter_by(id=receivers_id).first()
+    detail = MoreDetail.query.filter_by(user_id=receivers_id).first()
+
+    if not user or not detail:
+        raise LookupError("Receiver not found or missing details.")
+
+    ai_message_text = generate_reply(build_system_prompt(user, detail), payload["message"])
+
+    ai_msg = Message(
+        message=ai_message_text,
+        sender=receivers_id,  # AI "sender" could be receiver_id or a special bot user ID
+        receiver=sender_id,
+        timestamp=datetime.utcnow()
+    )
+
+    try:
+        db.session.add(ai_msg)
+        db.session.flush()
+        record_messages([{
+            "id": ai_msg.id,
+            "message": ai_msg.message,
+            "sender": ai_msg.sender,
+            "receiver": ai_msg.receiver,
+            "timestamp": ai_msg.timestamp
+        }])
+        job.result = {"ai_response": ai_msg.to_dict()}
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return job.result
@@ -0,0 +1,81 @@
+import os
+from dotenv import load_dotenv
+
+# Load .env before any of the settings below read the environment
+load_dotenv()
+
+
+def _flag(name, default=False):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes')
+
+
+def _names(name):
+    return frozenset(value.strip() for value in os.environ.get(name, '').split(',') if value.strip())
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URI')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    SECRET_KEY = os.getenv('FLASK_SECRET_KEY', 'default_secret_key')
+    JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'default_jwt_secret_key')
+
+    # Comma separated usernames allowed into /admin endpoints. The role a user registers with is never trusted for this
+    ADMIN_USERNAMES = _names('ADMIN_USERNAMES')
+
+    OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+    OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
+
+    MESSAGE_ARCHIVE_AFTER_DAYS = int(os.environ.get('MESSAGE_ARCHIVE_AFTER_DAYS', 180))
+    # Only helps with threaded workers (gunicorn gthread); with sync workers it only adds MESSAGE_WRITE_INTERVAL_MS per write
+    MESSAGE_WRITE_COALESCING = _flag('MESSAGE_WRITE_COALESCING')
+    MESSAGE_WRITE_INTERVAL_MS = float(os.environ.get('MESSAGE_WRITE_INTERVAL_MS', 5))
+
+    RATELIMIT_ENABLED = _flag('RATELIMIT_ENABLED', True)
+    RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI', 'memory://')
+    # Buckets kept by the in-memory store before the least recently used ones are dropped
+    RATELIMIT_MAX_KEYS = int(os.environ.get('RATELIMIT_MAX_KEYS', 100000))
+    RATELIMIT_MAX_TRACKED_KEYS = int(os.environ.get('RATELIMIT_MAX_TRACKED_KEYS', 10000))
+
+    # Number of reverse proxies in front of the app. 0 means client addresses are taken from the socket as is
+    TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+
+    PROFILING_ENABLED = _flag('PROFILING_ENABLED')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+    PROFILING_ENGINE = os.environ.get('PROFILING_ENGINE', 'cprofile')
+    if os.environ.get('PROFILING_OUTPUT_DIR'):
+        PROFILING_OUTPUT_DIR = os.environ['PROFILING_OUTPUT_DIR']
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URI', 'sqlite://')
+    RATELIMIT_ENABLED = False
+
+
+class ProductionConfig(Config):
+    pass
+
+
+configs = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
+
+
+# Picks the config class from APP_ENV (development, testing or production), defaulting to development
+def get_config(name=None):
+    name = name or os.environ.get('APP_ENV', 'development')
+
+    if name not in configs:
+        raise ValueError(f"Unknown APP_ENV: {name}. Expected one of {', '.join(configs)}")
+
+    return configs[name]
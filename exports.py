@@ -0,0 +1,82 @@
+import csv
+import io
+from sqlalchemy import select, union_all
+from models import db, Message
+from serializers import MESSAGE_SCHEMA, MESSAGE_ARCHIVE_SCHEMA, ORDER_SCHEMA, ORDER_ITEM_SCHEMA, dumps
+
+# Tables that can be exported. Rows are always streamed in id order so the last id written can be used to resume.
+EXPORTS = {
+    "messages": MESSAGE_SCHEMA,
+    "orders": ORDER_SCHEMA,
+    "order_items": ORDER_ITEM_SCHEMA,
+}
+
+FORMATS = ("ndjson", "csv")
+
+
+# Checks the export options up front, so errors are reported before any of the response is sent
+def check_export(table, format="ndjson", since=None):
+    if table not in EXPORTS:
+        raise ValueError(f"Unknown table: {table}. Expected one of {', '.join(EXPORTS)}")
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format: {format}. Expected one of {', '.join(FORMATS)}")
+    if since is not None and EXPORTS[table].model is not Message:
+        raise ValueError("since is only supported for messages")
+
+
+# Tables whose older rows are moved elsewhere over time. Their export includes those rows too, so it stays complete.
+ARCHIVES = {
+    "messages": MESSAGE_ARCHIVE_SCHEMA,
+}
+
+
+def _select(schema, after_id=None, since=None):
+    statement = select(*schema.fields.values())
+    if after_id is not None:
+        statement = statement.where(schema.model.id > after_id)
+    if since is not None:
+        statement = statement.where(schema.fields["timestamp"] >= since)
+    return statement
+
+
+# Streams batches of rows for a table using a server side cursor, so memory stays constant however big the table is.
+# `after_id` resumes after the last exported row, `since` (messages only) skips rows older than a timestamp.
+# Archived messages keep their ids, so they are merged into the same id ordered stream as the live ones.
+def iter_batches(table, after_id=None, since=None, batch_size=1000):
+    schema = EXPORTS[table]
+
+    statement = _select(schema, after_id, since)
+    if table in ARCHIVES:
+        statement = union_all(statement, _select(ARCHIVES[table], after_id, since))
+    statement = statement.order_by(statement.selected_columns.id)
+
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+
+    yield from result.partitions()
+
+
+def ndjson_chunks(table, **options):
+    names = list(EXPORTS[table].fields)
+
+    for rows in iter_batches(table, **options):
+        yield b"".join(dumps(dict(zip(names, row))) + b"\n" for row in rows)
+
+
+def csv_chunks(table, **options):
+    def encode(rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+    yield encode([list(EXPORTS[table].fields)])
+
+    for rows in iter_batches(table, **options):
+        yield encode([value.isoformat() if hasattr(value, "isoformat") else value for value in row] for row in rows)
+
+
+def export_chunks(table, format="ndjson", **options):
+    check_export(table, format, options.get("since"))
+
+    if format == "csv":
+        return csv_chunks(table, **options)
+    return ndjson_chunks(table, **options)
@@ -0,0 +1,198 @@
+from datetime import timedelta
+from math import radians, sin, cos, asin, sqrt, floor
+import threading
+from flask import current_app
+
+# Known towns mapped to (latitude, longitude) so that the free text in MoreDetail.location can be placed on a map
+LOCATION_COORDINATES = {
+    "nairobi": (-1.2921, 36.8219),
+    "mombasa": (-4.0435, 39.6682),
+    "kisumu": (-0.0917, 34.7680),
+    "eldoret": (0.5143, 35.2698),
+    "thika": (-1.0333, 37.0693),
+    "machakos": (-1.5177, 37.2634),
+    "naivasha": (-0.7172, 36.4310),
+    "nakuru": (-0.3031, 36.0800),
+    "nyeri": (-0.4201, 36.9476),
+    "kiambu": (-1.1714, 36.8356),
+    "kitale": (1.0157, 35.0062),
+    "kakamega": (0.2827, 34.7519),
+    "kericho": (-0.3677, 35.2831),
+    "meru": (0.0463, 37.6559),
+    "malindi": (-3.2192, 40.1169),
+    "garissa": (-0.4532, 39.6461),
+}
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+# Largest search radius accepted by /serviceproviders, wide enough to cover the whole country
+MAX_RADIUS_KM = 1000
+
+
+# Turns a location like "Nairobi" or " thika, Kenya " into coordinates, or None if we don't know the place
+def normalize_location(location):
+    if not location:
+        return None
+
+    name = str(location).split(",")[0].strip().lower()
+
+    return LOCATION_COORDINATES.get(name)
+
+
+# Parses the `near` query parameter, which is either "lat,lng" or a known town name
+def parse_point(value):
+    if not value:
+        return None
+
+    parts = value.split(",")
+    if len(parts) == 2:
+        try:
+            lat, lng = float(parts[0]), float(parts[1])
+        except ValueError:
+            return normalize_location(value)
+
+        if -90 <= lat <= 90 and -180 <= lng <= 180:
+            return lat, lng
+        return None
+
+    return normalize_location(value)
+
+
+# Great circle distance between two points in kilometres
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(radians, (lat1, lng1, lat2, lng2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lng2 - lng1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+
+
+# This class keeps provider positions in fixed size grid buckets held in memory.
+# A radius query only visits the buckets overlapping the search area instead of every provider,
+# and add/remove are O(1) so the index can be kept up to date as details are posted.
+class GridIndex:
+    def __init__(self, cell_size=0.25):
+        self.cell_size = cell_size
+        self.buckets = {}
+        self.positions = {}
+        self.lock = threading.Lock()
+
+    def _cell(self, lat, lng):
+        return (floor(lat / self.cell_size), floor(lng / self.cell_size))
+
+    def _discard(self, key):
+        previous = self.positions.pop(key, None)
+        if previous is None:
+            return
+
+        cell = self._cell(*previous)
+        bucket = self.buckets.get(cell)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self.buckets[cell]
+
+    def add(self, key, lat, lng):
+        with self.lock:
+            self._discard(key)
+            self.positions[key] = (lat, lng)
+            self.buckets.setdefault(self._cell(lat, lng), {})[key] = (lat, lng)
+
+    def remove(self, key):
+        with self.lock:
+            self._discard(key)
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+            self.positions.clear()
+
+    def __len__(self):
+        return len(self.positions)
+
+    # Returns [(key, distance_km), ...] within radius_km of the point, nearest first
+    def query(self, lat, lng, radius_km):
+        lat_span = radius_km / KM_PER_DEGREE
+        lng_span = radius_km / max(KM_PER_DEGREE * cos(radians(lat)), 1e-6)
+
+        min_x, min_y = self._cell(lat - lat_span, lng - lng_span)
+        max_x, max_y = self._cell(lat + lat_span, lng + lng_span)
+
+        results = []
+        with self.lock:
+            # For very large radii it is cheaper to walk the occupied buckets than the empty cells in the box
+            if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self.buckets):
+                cells = [cell for cell in self.buckets if min_x <= cell[0] <= max_x and min_y <= cell[1] <= max_y]
+            else:
+                cells = [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+
+            for cell in cells:
+                for key, (point_lat, point_lng) in self.buckets.get(cell, {}).items():
+                    distance = haversine_km(lat, lng, point_lat, point_lng)
+                    if distance <= radius_km:
+                        results.append((key, distance))
+
+        results.sort(key=lambda item: item[1])
+        return results
+
+
+# This class holds the spatial index of service providers keyed by user id.
+# It is loaded from the database on first use and afterwards only re-reads detail rows whose updated_at is newer
+# than the last sync, so inserts and location changes made by other workers are picked up without a full rebuild.
+# The `overlap` window re-reads recent rows so transactions that committed late are not missed.
+class ProviderIndex:
+    def __init__(self, cell_size=0.25, overlap=timedelta(seconds=60)):
+        self.grid = GridIndex(cell_size)
+        self.synced_at = None
+        self.overlap = overlap
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        from models import db, User, MoreDetail
+
+        with self.lock:
+            query = db.session.query(
+                MoreDetail.user_id, MoreDetail.latitude, MoreDetail.longitude, MoreDetail.updated_at, User.role
+            ).join(User, User.id == MoreDetail.user_id)
+
+            if self.synced_at is not None:
+                query = query.filter(MoreDetail.updated_at >= self.synced_at - self.overlap)
+
+            for user_id, lat, lng, updated_at, role in query.order_by(MoreDetail.updated_at.asc(), MoreDetail.id.asc()):
+                if role == 'Worker' and lat is not None and lng is not None:
+                    self.grid.add(user_id, lat, lng)
+                else:
+                    self.grid.remove(user_id)
+
+                if updated_at is not None and (self.synced_at is None or updated_at > self.synced_at):
+                    self.synced_at = updated_at
+
+    # Applies a change made in this worker straight away; only workers are ever placed in the index
+    def update(self, user_id, lat, lng):
+        from models import db, User
+
+        role = db.session.scalar(db.select(User.role).where(User.id == user_id))
+
+        if role != 'Worker' or lat is None or lng is None:
+            self.grid.remove(user_id)
+        else:
+            self.grid.add(user_id, lat, lng)
+
+    def reset(self):
+        with self.lock:
+            self.grid.clear()
+            self.synced_at = None
+
+    def nearest(self, lat, lng, radius_km):
+        self.refresh()
+        return self.grid.query(lat, lng, radius_km)
+
+
+# Each app keeps its own index in app.extensions['provider_index'], built the first time it is needed
+def get_provider_index():
+    index = current_app.extensions.get('provider_index')
+
+    if index is None:
+        index = current_app.extensions.setdefault('provider_index', ProviderIndex())
+
+    return index
@@ -0,0 +1,104 @@
+from sqlalchemy import select, update, insert, delete, case, func, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Message, Conversation
+
+UPSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+# Updates (or creates) one user's summary row for a conversation with the new last message.
+# Writes can commit out of order, so last_* only moves forward to a newer message id while unread always adds up.
+def _touch(user_id, partner_id, row, unread):
+    values = {
+        "last_message_id": row["id"],
+        "last_message": row["message"],
+        "last_timestamp": row["timestamp"],
+    }
+
+    def newer(name, new_id, new_value):
+        return case((new_id > func.coalesce(Conversation.last_message_id, 0), new_value), else_=getattr(Conversation, name))
+
+    upsert = UPSERTS.get(db.session.get_bind().dialect.name)
+    if upsert is not None:
+        statement = upsert(Conversation).values(user_id=user_id, partner_id=partner_id, unread_count=unread, **values)
+        excluded = statement.excluded
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=["user_id", "partner_id"],
+            set_=dict(
+                {name: newer(name, excluded.last_message_id, excluded[name]) for name in values},
+                unread_count=Conversation.unread_count + unread
+            )
+        ))
+        return
+
+    updated = db.session.execute(
+        update(Conversation)
+        .where(Conversation.user_id == user_id, Conversation.partner_id == partner_id)
+        .values(
+            unread_count=Conversation.unread_count + unread,
+            **{name: newer(name, literal(row["id"]), value) for name, value in values.items()}
+        )
+    ).rowcount
+    if not updated:
+        db.session.execute(insert(Conversation).values(user_id=user_id, partner_id=partner_id, unread_count=unread, **values))
+
+
+# Called in the same transaction as the message inserts. Rows are dicts with id, message, sender, receiver and timestamp.
+# A batch of rows is folded into one update per summary row, and the sender's own copy is never marked unread.
+# Summary rows are always updated in key order, so two concurrent batches lock them in the same order and can't deadlock.
+def record_messages(rows):
+    summaries = {}
+
+    for row in sorted(rows, key=lambda row: row["id"]):
+        sides = [(row["sender"], row["receiver"], 0)]
+        # A message to yourself only has the one summary row, and you have already read it
+        if str(row["sender"]) != str(row["receiver"]):
+            sides.append((row["receiver"], row["sender"], 1))
+
+        for user_id, partner_id, unread in sides:
+            key = (str(user_id), str(partner_id))
+            previous = summaries.get(key)
+            summaries[key] = (user_id, partner_id, row, unread + (previous[3] if previous else 0))
+
+    for key in sorted(summaries):
+        _touch(*summaries[key])
+
+
+# Marks everything in the conversation with partner_id as read for user_id
+def mark_read(user_id, partner_id):
+    updated = db.session.execute(
+        update(Conversation)
+        .where(Conversation.user_id == user_id, Conversation.partner_id == partner_id)
+        .values(unread_count=0, last_read_message_id=Conversation.last_message_id)
+    ).rowcount
+    db.session.commit()
+
+    return updated > 0
+
+
+# Rebuilds every summary row from the live messages table, with everything marked as read.
+# Used once after the conversations table is added, or if it ever gets out of step.
+def rebuild_conversations(batch_size=5000):
+    latest = {}
+
+    statement = select(Message.id, Message.message, Message.sender, Message.receiver, Message.timestamp).order_by(Message.id)
+    for id, message, sender, receiver, timestamp in db.session.execute(statement.execution_options(yield_per=batch_size)):
+        row = {"last_message_id": id, "last_message": message, "last_timestamp": timestamp}
+        latest[(sender, receiver)] = row
+        latest[(receiver, sender)] = row
+
+    try:
+        db.session.execute(delete(Conversation))
+        if latest:
+            db.session.execute(insert(Conversation), [
+                dict(row, user_id=user_id, partner_id=partner_id, unread_count=0, last_read_message_id=row["last_message_id"])
+                for (user_id, partner_id), row in latest.items()
+            ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return len(latest)
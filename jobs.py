@@ -0,0 +1,212 @@
+from datetime import datetime, timedelta
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from sqlalchemy import select, update
+from models import db, Job, DeadLetterJob
+
+logger = logging.getLogger(__name__)
+
+# Functions that run each kind of job, registered with @job_handler
+handlers = {}
+
+
+def job_handler(kind):
+    def decorator(func):
+        handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload, user_id=None, max_attempts=5, delay=0):
+    if kind not in handlers:
+        raise ValueError(f"No handler registered for job kind: {kind}")
+
+    job = Job(
+        kind=kind,
+        payload=payload,
+        user_id=user_id,
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay)
+    )
+
+    try:
+        db.session.add(job)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return job
+
+
+# Exponential backoff between attempts: 2s, 4s, 8s, ... up to `cap` seconds
+def backoff_seconds(attempts, base=2, cap=300):
+    return min(cap, base * 2 ** (attempts - 1))
+
+
+# Takes the next due job and marks it running. FOR UPDATE SKIP LOCKED keeps PostgreSQL workers from
+# waiting on each other, and the conditional UPDATE makes sure only one worker wins a job on every database.
+def claim_job(worker_id):
+    now = datetime.utcnow()
+
+    job_id = db.session.scalars(
+        select(Job.id)
+        .where(Job.status == 'queued', Job.run_at <= now)
+        .order_by(Job.run_at, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).first()
+
+    if job_id is None:
+        db.session.rollback()
+        return None
+
+    claimed = db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == 'queued')
+        .values(status='running', attempts=Job.attempts + 1, locked_by=worker_id, started_at=now)
+    ).rowcount
+    db.session.commit()
+
+    if claimed != 1:
+        return None
+
+    return db.session.get(Job, job_id)
+
+
+# Records a failed attempt: the job is retried after a backoff, or moved to dead_letter_jobs once it has
+# used all of its attempts. The caller commits.
+def fail_job(job, error, base_backoff=2, max_backoff=300):
+    job.last_error = error
+    job.locked_by = None
+
+    if job.attempts >= job.max_attempts:
+        job.status = 'failed'
+        job.finished_at = datetime.utcnow()
+        db.session.add(DeadLetterJob(
+            job_id=job.id,
+            kind=job.kind,
+            payload=job.payload,
+            attempts=job.attempts,
+            error=job.last_error
+        ))
+    else:
+        job.status = 'queued'
+        job.run_at = datetime.utcnow() + timedelta(seconds=backoff_seconds(job.attempts, base_backoff, max_backoff))
+
+
+# Handlers are called with the job itself, so they can keep progress in job.result and skip work
+# that an earlier attempt already committed
+def run_job(job, base_backoff=2, max_backoff=300):
+    try:
+        result = handlers[job.kind](job)
+    except Exception as e:
+        db.session.rollback()
+        logger.warning("Job %s (%s) failed on attempt %s: %s", job.id, job.kind, job.attempts, e)
+
+        fail_job(job, "".join(traceback.format_exception_only(type(e), e)).strip(), base_backoff, max_backoff)
+        db.session.commit()
+        return False
+
+    job.status = 'done'
+    job.result = result
+    job.last_error = None
+    job.locked_by = None
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return True
+
+
+# Handles jobs whose worker died without finishing them: they are retried, or dead-lettered
+# when the lost run was their last attempt. Returns how many jobs were swept.
+def requeue_stale_jobs(timeout):
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+
+    stale = db.session.scalars(
+        select(Job)
+        .where(Job.status == 'running', Job.started_at < cutoff)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    for job in stale:
+        fail_job(job, f"Worker {job.locked_by} did not finish the job within {timeout}s")
+        # The worker is gone, so there is no reason to wait out a backoff
+        if job.status == 'queued':
+            job.run_at = datetime.utcnow()
+
+    db.session.commit()
+    return len(stale)
+
+
+# This class runs `concurrency` threads in one process, each polling the jobs table.
+# Start it with `flask worker`, separately from the web server, so the two can be scaled independently.
+class Worker:
+    def __init__(self, app, concurrency=None):
+        self.app = app
+        self.concurrency = concurrency or app.config.get('JOB_WORKERS', 4)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', 1.0)
+        self.stale_timeout = app.config.get('JOB_TIMEOUT', 300)
+        self.sweep_interval = app.config.get('JOB_SWEEP_INTERVAL', 60)
+        self.stopping = threading.Event()
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+
+    def run_once(self, worker_id):
+        with self.app.app_context():
+            job = claim_job(worker_id)
+            if job is None:
+                return False
+
+            run_job(job, self.app.config.get('JOB_BASE_BACKOFF', 2), self.app.config.get('JOB_MAX_BACKOFF', 300))
+            return True
+
+    def _loop(self, index):
+        worker_id = f"{self.name}:{index}"
+
+        while not self.stopping.is_set():
+            try:
+                if not self.run_once(worker_id):
+                    self.stopping.wait(self.poll_interval)
+            except Exception:
+                logger.exception("Worker %s crashed while running a job", worker_id)
+                self.stopping.wait(self.poll_interval)
+
+    # Stale jobs are swept at startup and then every JOB_SWEEP_INTERVAL seconds, so jobs lost by another
+    # worker process are picked up without restarting this one
+    def sweep(self):
+        try:
+            with self.app.app_context():
+                swept = requeue_stale_jobs(self.stale_timeout)
+        except Exception:
+            logger.exception("Sweeping stale jobs failed")
+            return
+
+        if swept:
+            logger.info("Swept %s stale jobs", swept)
+
+    def run(self):
+        self.sweep()
+        next_sweep = time.monotonic() + self.sweep_interval
+
+        threads = [threading.Thread(target=self._loop, args=(index,), daemon=True) for index in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(0.5)
+
+                if time.monotonic() >= next_sweep:
+                    self.sweep()
+                    next_sweep = time.monotonic() + self.sweep_interval
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
+
+    def stop(self):
+        self.stopping.set()
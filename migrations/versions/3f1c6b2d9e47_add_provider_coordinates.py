@@ -0,0 +1,76 @@
+"""Add provider coordinates
+
+Revision ID: 3f1c6b2d9e47
+Revises: a9da547dda3d
+Create Date: 2026-10-19 09:12:40.118302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c6b2d9e47'
+down_revision = 'a9da547dda3d'
+branch_labels = None
+depends_on = None
+
+# Copy of geo.LOCATION_COORDINATES at the time of this migration, so later edits to geo.py don't change what it does
+LOCATION_COORDINATES = {
+    "nairobi": (-1.2921, 36.8219),
+    "mombasa": (-4.0435, 39.6682),
+    "kisumu": (-0.0917, 34.7680),
+    "eldoret": (0.5143, 35.2698),
+    "thika": (-1.0333, 37.0693),
+    "machakos": (-1.5177, 37.2634),
+    "naivasha": (-0.7172, 36.4310),
+    "nakuru": (-0.3031, 36.0800),
+    "nyeri": (-0.4201, 36.9476),
+    "kiambu": (-1.1714, 36.8356),
+    "kitale": (1.0157, 35.0062),
+    "kakamega": (0.2827, 34.7519),
+    "kericho": (-0.3677, 35.2831),
+    "meru": (0.0463, 37.6559),
+    "malindi": (-3.2192, 40.1169),
+    "garissa": (-0.4532, 39.6461),
+}
+
+
+def upgrade():
+    with op.batch_alter_table('more_details', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+
+    # Place existing providers using the known towns table as it was when this migration was written.
+    # Locations are matched like geo.normalize_location: the part before the first comma, trimmed and lowercased.
+    more_details = sa.table('more_details',
+        sa.column('id', sa.Integer()),
+        sa.column('location', sa.String()),
+        sa.column('latitude', sa.Float()),
+        sa.column('longitude', sa.Float()),
+    )
+
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(more_details.c.id, more_details.c.location).where(more_details.c.location.isnot(None))
+    ).all()
+
+    updates = []
+    for id, location in rows:
+        point = LOCATION_COORDINATES.get(location.split(",")[0].strip().lower())
+        if point:
+            updates.append({"row_id": id, "lat": point[0], "lng": point[1]})
+
+    if updates:
+        bind.execute(
+            more_details.update()
+            .where(more_details.c.id == sa.bindparam("row_id"))
+            .values(latitude=sa.bindparam("lat"), longitude=sa.bindparam("lng")),
+            updates
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('more_details', schema=None) as batch_op:
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
@@ -0,0 +1,113 @@
+"""Partition messages by month and add messages archive
+
+Revision ID: 8b2e4f71c0a5
+Revises: 3f1c6b2d9e47
+Create Date: 2026-10-19 13:20:05.402117
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4f71c0a5'
+down_revision = '3f1c6b2d9e47'
+branch_labels = None
+depends_on = None
+
+# Monthly partitions are created this far past the current month, `flask archive-messages` keeps adding more
+MONTHS_AHEAD = 3
+
+
+def _next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def upgrade():
+    op.create_table('messages_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('message', sa.String(), nullable=True),
+    sa.Column('receiver', sa.Integer(), nullable=False),
+    sa.Column('sender', sa.Integer(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_messages_archive_sender_receiver_id', 'messages_archive', ['sender', 'receiver', 'id'], unique=False)
+
+    if op.get_bind().dialect.name != 'postgresql':
+        op.create_index('ix_messages_sender_receiver_id', 'messages', ['sender', 'receiver', 'id'], unique=False)
+        return
+
+    # PostgreSQL: rebuild messages as a table range partitioned by month on timestamp.
+    # The partition key has to be part of the primary key, so it becomes (id, timestamp) and timestamp is made NOT NULL.
+    op.execute("ALTER TABLE messages RENAME TO messages_unpartitioned")
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE messages (
+            id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+            message VARCHAR,
+            receiver INTEGER NOT NULL REFERENCES users (id),
+            sender INTEGER NOT NULL REFERENCES users (id),
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+
+    oldest = op.get_bind().execute(sa.text("SELECT min(timestamp) FROM messages_unpartitioned")).scalar()
+    month = datetime(*(oldest or datetime.utcnow()).timetuple()[:2], 1)
+    last = datetime.utcnow()
+    for _ in range(MONTHS_AHEAD):
+        last = _next_month(last)
+
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE messages_y{month.year:04d}m{month.month:02d} PARTITION OF messages "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+        )
+        month = _next_month(month)
+    op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+
+    op.execute("""
+        INSERT INTO messages (id, message, receiver, sender, timestamp)
+        SELECT id, message, receiver, sender, COALESCE(timestamp, now() AT TIME ZONE 'utc')
+        FROM messages_unpartitioned
+    """)
+    op.execute("DROP TABLE messages_unpartitioned")
+
+    op.create_index('ix_messages_sender_receiver_id', 'messages', ['sender', 'receiver', 'id'], unique=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+        op.execute("ALTER SEQUENCE messages_id_seq OWNED BY NONE")
+        op.execute("""
+            CREATE TABLE messages (
+                id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+                message VARCHAR,
+                receiver INTEGER NOT NULL REFERENCES users (id),
+                sender INTEGER NOT NULL REFERENCES users (id),
+                timestamp TIMESTAMP WITHOUT TIME ZONE,
+                PRIMARY KEY (id)
+            )
+        """)
+        op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+        op.execute("""
+            INSERT INTO messages (id, message, receiver, sender, timestamp)
+            SELECT id, message, receiver, sender, timestamp FROM messages_archive
+            UNION ALL
+            SELECT id, message, receiver, sender, timestamp FROM messages_partitioned
+        """)
+        op.execute("DROP TABLE messages_partitioned")
+    else:
+        op.drop_index('ix_messages_sender_receiver_id', table_name='messages')
+        op.execute("""
+            INSERT INTO messages (id, message, receiver, sender, timestamp)
+            SELECT id, message, receiver, sender, timestamp FROM messages_archive
+        """)
+
+    op.drop_index('ix_messages_archive_sender_receiver_id', table_name='messages_archive')
+    op.drop_table('messages_archive')
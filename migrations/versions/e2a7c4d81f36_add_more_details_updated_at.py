@@ -0,0 +1,30 @@
+"""Add more_details updated_at
+
+Revision ID: e2a7c4d81f36
+Revises: d5e8a3f0b912
+Create Date: 2026-10-20 09:41:12.508331
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c4d81f36'
+down_revision = 'd5e8a3f0b912'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('more_details', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_more_details_updated_at'), ['updated_at'], unique=False)
+
+    op.execute(sa.text("UPDATE more_details SET updated_at = CURRENT_TIMESTAMP"))
+
+
+def downgrade():
+    with op.batch_alter_table('more_details', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_more_details_updated_at'))
+        batch_op.drop_column('updated_at')
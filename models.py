@@ -58,8 +58,12 @@ class MoreDetail(db.Model):
     completionRate = db.Column(db.String)
     rating = db.Column(db.String)
     location = db.Column(db.String)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     responseTime = db.Column(db.String)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    # Lets each worker's provider index pick up details changed by other workers
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now(), index=True)
 
     def to_dict(self):
         return{
@@ -72,6 +76,8 @@ class MoreDetail(db.Model):
             "completionRate": self.completionRate,
             "rating":self.rating,
             "location": self.location,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
             "responseTime":self.responseTime,
             "user_id": self.user_id
         }
@@ -105,6 +111,10 @@ class Message(db.Model):
     sender = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_messages_sender_receiver_id', 'sender', 'receiver', 'id'),
+    )
+
     def to_dict(self):
         return{
             'id': self.id,
@@ -116,6 +126,32 @@ class Message(db.Model):
     def __repr__(self):
         return (f"<Message(id={self.id} message={self.message} receiver={self.receiver} sender={self.sender})>")
 
+# Messages older than MESSAGE_ARCHIVE_AFTER_DAYS are moved here by `flask archive-messages`, keeping their original ids
+class MessageArchive(db.Model):
+    __tablename__ = 'messages_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    message = db.Column(db.String)
+    receiver = db.Column(db.Integer, nullable=False)
+    sender = db.Column(db.Integer, nullable=False)
+    timestamp = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_messages_archive_sender_receiver_id', 'sender', 'receiver', 'id'),
+    )
+
+    def to_dict(self):
+        return{
+            'id': self.id,
+            'message':self.message,
+            'receiver':self.receiver,
+            'sender':self.sender
+        }
+
+    def __repr__(self):
+        return (f"<MessageArchive(id={self.id} message={self.message} receiver={self.receiver} sender={self.sender})>")
+
 
 class Order(db.Model):
     __tablename__ = 'orders'
@@ -170,3 +206,95 @@ class OrderItem(db.Model):
     
     def __repr__(self):
         return {f"<OrderItem(id={self.id} descriptio={self.description}, price={self.price})"}
+
+# Background work picked up by `flask worker`. Jobs that keep failing are copied to dead_letter_jobs.
+class Job(db.Model):
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String, nullable=False)
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String, nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String)
+    result = db.Column(db.JSON)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    def to_dict(self):
+        return{
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "result": self.result,
+            "error": self.last_error
+        }
+
+    def __repr__(self):
+        return (f"<Job(id={self.id} kind={self.kind} status={self.status} attempts={self.attempts})>")
+
+class DeadLetterJob(db.Model):
+    __tablename__ = 'dead_letter_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String, nullable=False)
+    payload = db.Column(db.JSON)
+    attempts = db.Column(db.Integer)
+    error = db.Column(db.String)
+    failed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return{
+            "id": self.id,
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "payload": self.payload,
+            "attempts": self.attempts,
+            "error": self.error,
+            "failed_at": self.failed_at.isoformat() if self.failed_at else None
+        }
+
+    def __repr__(self):
+        return (f"<DeadLetterJob(id={self.id} job_id={self.job_id} kind={self.kind})>")
+
+# One row per user and conversation partner, kept up to date on every message insert so the inbox is a single indexed query
+class Conversation(db.Model):
+    __tablename__ = 'conversations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    partner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    last_message_id = db.Column(db.Integer)
+    last_message = db.Column(db.String)
+    last_timestamp = db.Column(db.DateTime)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+    last_read_message_id = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'partner_id', name='uq_conversations_user_partner'),
+        db.Index('ix_conversations_user_last_timestamp', 'user_id', 'last_timestamp'),
+    )
+
+    def to_dict(self):
+        return{
+            "partner_id": self.partner_id,
+            "last_message_id": self.last_message_id,
+            "last_message": self.last_message,
+            "last_timestamp": self.last_timestamp.isoformat() if self.last_timestamp else None,
+            "unread_count": self.unread_count,
+            "last_read_message_id": self.last_read_message_id
+        }
+
+    def __repr__(self):
+        return (f"<Conversation(user_id={self.user_id} partner_id={self.partner_id} unread_count={self.unread_count})>")
@@ -0,0 +1,220 @@
+from datetime import datetime
+import cProfile
+import json
+import os
+import random
+import threading
+import time
+from flask import current_app, g, request
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+# pyinstrument gives lower overhead sampling profiles, but cProfile from the standard library is used without it
+try:
+    import pyinstrument
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:
+    pyinstrument = None
+
+
+# Per-app settings, plus when state.json was last read
+class _ProfilerState:
+    def __init__(self, app):
+        self.enabled = app.config['PROFILING_ENABLED']
+        self.sample_rate = app.config['PROFILING_SAMPLE_RATE']
+        self.engine = app.config['PROFILING_ENGINE']
+        self.output_dir = app.config['PROFILING_OUTPUT_DIR']
+        self.max_files = app.config['PROFILING_MAX_FILES']
+        self.token_max_age = app.config['PROFILING_TOKEN_MAX_AGE']
+        self.serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt="profiling")
+        self.state_mtime = None
+        self.next_state_check = 0
+        self.lock = threading.Lock()
+
+
+# This class profiles a fraction of requests, plus any request sent with a signed X-Profile header,
+# and writes one file per request under PROFILING_OUTPUT_DIR/<endpoint>/.
+# cProfile output (.prof) opens in snakeviz or flameprof; pyinstrument output is speedscope JSON.
+# Settings can be changed at runtime through /admin/profiling. They are saved to state.json in the output
+# directory, which every worker re-reads every few seconds. While profiling is disabled, each request only
+# costs a flag check and a clock read. Settings are kept per app in app.extensions['profiler'].
+class Profiler:
+    header = "X-Profile"
+    state_check_interval = 2
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILING_ENABLED', False)
+        app.config.setdefault('PROFILING_SAMPLE_RATE', 0.0)
+        app.config.setdefault('PROFILING_ENGINE', 'cprofile')
+        app.config.setdefault('PROFILING_OUTPUT_DIR', os.path.join(app.instance_path, 'profiles'))
+        app.config.setdefault('PROFILING_MAX_FILES', 50)
+        app.config.setdefault('PROFILING_TOKEN_MAX_AGE', 3600)
+
+        if app.config['PROFILING_ENGINE'] == "pyinstrument" and pyinstrument is None:
+            raise RuntimeError("PROFILING_ENGINE is pyinstrument but the pyinstrument package is not installed")
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['profiler'] = _ProfilerState(app)
+
+    @property
+    def state(self):
+        return current_app.extensions['profiler']
+
+    @property
+    def output_dir(self):
+        return self.state.output_dir
+
+    @property
+    def token_max_age(self):
+        return self.state.token_max_age
+
+    def _state_path(self, state):
+        return os.path.join(state.output_dir, "state.json")
+
+    def settings(self):
+        state = self.state
+        return {"enabled": state.enabled, "sample_rate": state.sample_rate, "engine": state.engine}
+
+    def configure(self, enabled=None, sample_rate=None):
+        state = self.state
+
+        # JSON "false" is a non-empty string, so anything but a real boolean is refused rather than coerced
+        if enabled is not None and not isinstance(enabled, bool):
+            raise ValueError("enabled must be true or false")
+        if sample_rate is not None:
+            if isinstance(sample_rate, bool) or not isinstance(sample_rate, (int, float)):
+                raise ValueError("sample_rate must be a number")
+            if not 0 <= sample_rate <= 1:
+                raise ValueError("sample_rate must be between 0 and 1")
+
+        with state.lock:
+            if enabled is not None:
+                state.enabled = enabled
+            if sample_rate is not None:
+                state.sample_rate = float(sample_rate)
+
+            os.makedirs(state.output_dir, exist_ok=True)
+            with open(self._state_path(state), "w") as f:
+                json.dump({"enabled": state.enabled, "sample_rate": state.sample_rate}, f)
+            state.state_mtime = os.stat(self._state_path(state)).st_mtime
+
+        return self.settings()
+
+    # Picks up settings changed by another worker through the admin endpoint
+    def _sync_state(self, state):
+        now = time.monotonic()
+        if now < state.next_state_check:
+            return
+        state.next_state_check = now + self.state_check_interval
+
+        try:
+            mtime = os.stat(self._state_path(state)).st_mtime
+        except OSError:
+            return
+        if mtime == state.state_mtime:
+            return
+
+        try:
+            with open(self._state_path(state)) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        state.enabled = bool(saved.get("enabled", state.enabled))
+        state.sample_rate = float(saved.get("sample_rate", state.sample_rate))
+        state.state_mtime = mtime
+
+    def issue_token(self, user_id):
+        return self.state.serializer.dumps({"user_id": user_id})
+
+    def _has_valid_token(self, state):
+        token = request.headers.get(self.header)
+        if not token:
+            return False
+
+        try:
+            state.serializer.loads(token, max_age=state.token_max_age)
+        except BadSignature:
+            return False
+        return True
+
+    def _before_request(self):
+        state = self.state
+        self._sync_state(state)
+
+        if not state.enabled:
+            return
+        if not (self._has_valid_token(state) or random.random() < state.sample_rate):
+            return
+
+        # Only one cProfile session can be active at a time on Python 3.12+, so a request that overlaps
+        # another profiled one just isn't profiled. Profiling must never fail the request itself.
+        try:
+            if state.engine == "pyinstrument":
+                profile = pyinstrument.Profiler()
+                profile.start()
+            else:
+                profile = cProfile.Profile()
+                profile.enable()
+        except (RuntimeError, ValueError):
+            return
+
+        g._profile = (profile, time.perf_counter())
+
+    def _teardown_request(self, exception=None):
+        started = g.pop('_profile', None)
+        if started is None:
+            return
+
+        state = self.state
+        profile, start = started
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        try:
+            if state.engine == "pyinstrument":
+                profile.stop()
+            else:
+                profile.disable()
+        except (RuntimeError, ValueError):
+            return
+
+        try:
+            self._save(state, profile, request.endpoint or "unknown", elapsed_ms)
+        except OSError:
+            pass
+
+    def _save(self, state, profile, endpoint, elapsed_ms):
+        directory = os.path.join(state.output_dir, endpoint)
+        os.makedirs(directory, exist_ok=True)
+
+        name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{elapsed_ms:.0f}ms"
+        if state.engine == "pyinstrument":
+            with open(os.path.join(directory, f"{name}.speedscope.json"), "w") as f:
+                f.write(profile.output(renderer=SpeedscopeRenderer()))
+        else:
+            profile.dump_stats(os.path.join(directory, f"{name}.prof"))
+
+        # Keep only the newest files for each endpoint
+        files = sorted(os.listdir(directory))
+        for old in files[:-state.max_files]:
+            os.remove(os.path.join(directory, old))
+
+    # Lists saved profiles, newest first, grouped by endpoint
+    def profiles(self, limit=10):
+        output_dir = self.state.output_dir
+        if not os.path.isdir(output_dir):
+            return {}
+
+        listing = {}
+        for endpoint in sorted(os.listdir(output_dir)):
+            directory = os.path.join(output_dir, endpoint)
+            if os.path.isdir(directory):
+                listing[endpoint] = sorted(os.listdir(directory), reverse=True)[:limit]
+        return listing
+
+
+profiler = Profiler()
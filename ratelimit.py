@@ -0,0 +1,199 @@
+from collections import Counter, OrderedDict
+from functools import wraps
+from math import ceil
+import threading
+import time
+from flask import current_app, request
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+
+# redis is only needed when RATELIMIT_STORAGE_URI points at a redis server
+try:
+    import redis
+except ImportError:
+    redis = None
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+# Turns "5/minute" into (capacity, tokens added per second)
+def parse_limit(limit):
+    count, _, period = limit.partition("/")
+    count = int(count)
+    period = period.strip().rstrip("s")
+
+    if count <= 0 or period not in PERIODS:
+        raise ValueError(f"Invalid rate limit: {limit}. Expected something like 5/minute")
+
+    return count, count / PERIODS[period]
+
+
+# This class keeps token buckets in an LRU ordered dict in this process. Each check is one dict lookup under a lock.
+# At most `max_keys` buckets are kept. When a new key arrives at the limit, the bucket used least recently is dropped,
+# which is the one most likely to have refilled already, so memory stays bounded however many addresses show up.
+class MemoryBucketStore:
+    def __init__(self, max_keys=100000):
+        self.buckets = OrderedDict()
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+
+    # Takes one token from the bucket and returns (allowed, tokens left)
+    def take(self, key, capacity, rate, now):
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                tokens, updated = capacity, now
+                while len(self.buckets) >= self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                tokens, updated = bucket
+                self.buckets.move_to_end(key)
+
+            tokens = min(capacity, tokens + max(0, now - updated) * rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            self.buckets[key] = (tokens, now)
+
+            return allowed, tokens
+
+
+# This class keeps token buckets in redis so every web worker shares the same limits.
+# The refill and take happen in one Lua script, so the check is atomic across processes.
+class RedisBucketStore:
+    SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, uri, prefix="ratelimit:"):
+        if redis is None:
+            raise RuntimeError("The redis package is required for a redis:// RATELIMIT_STORAGE_URI")
+
+        self.client = redis.Redis.from_url(uri)
+        self.script = self.client.register_script(self.SCRIPT)
+        self.prefix = prefix
+
+    def take(self, key, capacity, rate, now):
+        allowed, tokens = self.script(keys=[self.prefix + key], args=[capacity, rate, now])
+        return bool(allowed), float(tokens)
+
+
+def store_from_uri(uri, max_keys=100000):
+    if not uri or uri.startswith("memory://"):
+        return MemoryBucketStore(max_keys)
+    if uri.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBucketStore(uri)
+    raise ValueError(f"Unsupported RATELIMIT_STORAGE_URI: {uri}")
+
+
+# Per-app state: the bucket store and the counters shown by /admin/ratelimits
+class _LimiterState:
+    def __init__(self, store, max_tracked_keys):
+        self.store = store
+        self.allowed = Counter()
+        self.throttled = Counter()
+        self.throttled_keys = Counter()
+        self.max_tracked_keys = max_tracked_keys
+        self.lock = threading.Lock()
+
+
+# This class is a Flask extension that applies token bucket limits to resource methods.
+# Limits are keyed by the JWT identity when there is one, otherwise by the client IP.
+# Defaults are given in the decorator and can be overridden per name with the RATELIMITS config dict.
+# Buckets and counters are kept per app in app.extensions['ratelimiter'].
+class RateLimiter:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+        app.config.setdefault('RATELIMITS', {})
+        app.config.setdefault('RATELIMIT_MAX_TRACKED_KEYS', 10000)
+        app.config.setdefault('RATELIMIT_MAX_KEYS', 100000)
+
+        app.extensions['ratelimiter'] = _LimiterState(
+            store_from_uri(app.config['RATELIMIT_STORAGE_URI'], app.config['RATELIMIT_MAX_KEYS']),
+            app.config['RATELIMIT_MAX_TRACKED_KEYS']
+        )
+
+    def _identity(self):
+        try:
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+        except Exception:
+            identity = None
+
+        if identity is not None:
+            return f"user:{identity}"
+        return f"ip:{request.remote_addr}"
+
+    def check(self, name, default):
+        state = current_app.extensions['ratelimiter']
+        capacity, rate = parse_limit(current_app.config['RATELIMITS'].get(name, default))
+        key = self._identity()
+
+        allowed, tokens = state.store.take(f"{name}:{key}", capacity, rate, time.time())
+
+        with state.lock:
+            if allowed:
+                state.allowed[name] += 1
+                return None
+
+            state.throttled[name] += 1
+            state.throttled_keys[(name, key)] += 1
+
+            # A flood from many addresses would otherwise grow this forever, so keep only the worst offenders
+            if len(state.throttled_keys) > state.max_tracked_keys:
+                state.throttled_keys = Counter(dict(state.throttled_keys.most_common(state.max_tracked_keys // 2)))
+        return (1 - tokens) / rate
+
+    def limit(self, name, default):
+        parse_limit(default)
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if current_app.config['RATELIMIT_ENABLED']:
+                    retry_after = self.check(name, default)
+                    if retry_after is not None:
+                        return {"error": "Too many requests. Please try again later."}, 429, {"Retry-After": str(max(1, ceil(retry_after)))}
+
+                return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # Counters for this process, with the most throttled callers first
+    def stats(self, top=50):
+        state = current_app.extensions['ratelimiter']
+
+        with state.lock:
+            return {
+                "limits": {
+                    name: {"allowed": state.allowed[name], "throttled": state.throttled[name]}
+                    for name in set(state.allowed) | set(state.throttled)
+                },
+                "throttled": [
+                    {"limit": name, "key": key, "count": count}
+                    for (name, key), count in state.throttled_keys.most_common(top)
+                ],
+            }
+
+
+limiter = RateLimiter()
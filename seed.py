@@ -1,11 +1,13 @@
 from random import choice as rc
 from random import sample
 from faker import Faker
-from app import app
+from app import create_app
 from models import db, User, MoreDetail, Service
 from werkzeug.security import generate_password_hash
+from geo import normalize_location
 
 fake = Faker()
+app = create_app()
 
 with app.app_context():
     print("Deleting all records...")
@@ -63,6 +65,8 @@ with app.app_context():
             user_id=user.id
         )
 
+        more_detail.latitude, more_detail.longitude = normalize_location(more_detail.location)
+
         db.session.add(more_detail)
 
         # ✅ Assign at least 3 unique services to each user
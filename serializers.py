@@ -0,0 +1,191 @@
+from datetime import date, datetime
+import json
+from flask import Response
+from sqlalchemy import select
+from models import db, User, Message, MessageArchive, MoreDetail, Service, Order, OrderItem, Conversation
+
+# orjson is much faster than the standard library encoder, but the app still works without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+# Builds a JSON response directly, skipping Flask-RESTful's default encoder
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, mimetype="application/json")
+
+
+# This class describes which columns of a model can be serialized and how related rows are nested under it.
+# Rows are fetched as plain column tuples (never full ORM objects), so only the requested fields are read from the database.
+class Schema:
+    def __init__(self, model, fields, nested=None, default=None):
+        self.model = model
+        self.fields = fields
+        self.nested = nested or {}
+        self.default = default or list(fields)
+
+    # Turns "id,display_name,more_details.jobTitle" into {"id": None, "display_name": None, "more_details": ["jobTitle"]}
+    def parse_fields(self, fields=None):
+        if not fields:
+            return {name: None for name in self.default}
+
+        selected = {}
+        for name in fields.split(",") if isinstance(fields, str) else fields:
+            name = name.strip()
+            if not name:
+                continue
+
+            parent, _, child = name.partition(".")
+            if parent in self.fields and not child:
+                selected[parent] = None
+            elif parent in self.nested:
+                child_schema = self.nested[parent][0]
+                if child and child not in child_schema.fields:
+                    raise ValueError(f"Unknown field: {name}")
+                if not child:
+                    selected[parent] = None
+                elif parent not in selected or selected[parent] is not None:
+                    selected.setdefault(parent, []).append(child)
+            else:
+                raise ValueError(f"Unknown field: {name}")
+
+        return selected
+
+    def dump(self, *criteria, fields=None, order_by=None, limit=None):
+        selected = fields if isinstance(fields, dict) else self.parse_fields(fields)
+
+        names = [name for name in selected if name in self.fields]
+        nested = [name for name in selected if name in self.nested]
+
+        # The primary key is always read so that nested rows can be attached to their parent
+        columns = [self.fields[name] for name in names] + [self.model.id]
+        statement = select(*columns).where(*criteria)
+        if order_by is not None:
+            statement = statement.order_by(order_by)
+        if limit is not None:
+            statement = statement.limit(limit)
+
+        rows = db.session.execute(statement).all()
+        results = [dict(zip(names, row)) for row in rows]
+
+        for name in nested:
+            child_schema, foreign_key = self.nested[name]
+            child_names = selected[name] or child_schema.default
+            child_columns = [child_schema.fields[child] for child in child_names]
+
+            child_statement = (
+                select(foreign_key, *child_columns)
+                .join(self.model, self.model.id == foreign_key)
+                .order_by(child_schema.model.id)
+            )
+            if limit is None:
+                child_statement = child_statement.where(*criteria)
+            else:
+                child_statement = child_statement.where(foreign_key.in_([row[-1] for row in rows]))
+
+            grouped = {}
+            for row in db.session.execute(child_statement):
+                grouped.setdefault(row[0], []).append(dict(zip(child_names, row[1:])))
+
+            for result, row in zip(results, rows):
+                result[name] = grouped.get(row[-1], [])
+
+        return results
+
+
+MESSAGE_SCHEMA = Schema(Message, {
+    "id": Message.id,
+    "message": Message.message,
+    "receiver": Message.receiver,
+    "sender": Message.sender,
+    "timestamp": Message.timestamp,
+}, default=["id", "message", "receiver", "sender"])
+
+MESSAGE_ARCHIVE_SCHEMA = Schema(MessageArchive, {
+    "id": MessageArchive.id,
+    "message": MessageArchive.message,
+    "receiver": MessageArchive.receiver,
+    "sender": MessageArchive.sender,
+    "timestamp": MessageArchive.timestamp,
+}, default=MESSAGE_SCHEMA.default)
+
+DETAIL_SCHEMA = Schema(MoreDetail, {
+    "id": MoreDetail.id,
+    "category": MoreDetail.category,
+    "jobTitle": MoreDetail.jobTitle,
+    "description": MoreDetail.description,
+    "detailedDescription": MoreDetail.detailedDescription,
+    "payRate": MoreDetail.payRate,
+    "completionRate": MoreDetail.completionRate,
+    "rating": MoreDetail.rating,
+    "location": MoreDetail.location,
+    "latitude": MoreDetail.latitude,
+    "longitude": MoreDetail.longitude,
+    "responseTime": MoreDetail.responseTime,
+    "user_id": MoreDetail.user_id,
+})
+
+SERVICE_SCHEMA = Schema(Service, {
+    "id": Service.id,
+    "service": Service.service,
+    "user_id": Service.user_id,
+})
+
+# The password hash is never serialized, and the message lists are only included when asked for with ?fields=
+USER_SCHEMA = Schema(User, {
+    "id": User.id,
+    "first_name": User.first_name,
+    "last_name": User.last_name,
+    "display_name": User.display_name,
+    "date_of_birth": User.date_of_birth,
+    "email": User.email,
+    "username": User.username,
+    "role": User.role,
+}, nested={
+    "sent_messages": (MESSAGE_SCHEMA, Message.sender),
+    "received_messages": (MESSAGE_SCHEMA, Message.receiver),
+    "more_details": (DETAIL_SCHEMA, MoreDetail.user_id),
+    "services": (SERVICE_SCHEMA, Service.user_id),
+}, default=[
+    "id", "first_name", "last_name", "display_name", "date_of_birth",
+    "email", "username", "role", "more_details", "services",
+])
+
+ORDER_ITEM_SCHEMA = Schema(OrderItem, {
+    "id": OrderItem.id,
+    "description": OrderItem.description,
+    "price": OrderItem.price,
+    "order_id": OrderItem.order_id,
+})
+
+ORDER_SCHEMA = Schema(Order, {
+    "id": Order.id,
+    "buyer": Order.buyer,
+    "seller": Order.seller,
+}, nested={
+    "order_items": (ORDER_ITEM_SCHEMA, OrderItem.order_id),
+})
+
+# Inbox rows. partner_name comes from users, so dump() callers must join on Conversation.partner_id == User.id
+CONVERSATION_SCHEMA = Schema(Conversation, {
+    "partner_id": Conversation.partner_id,
+    "partner_name": User.display_name,
+    "last_message_id": Conversation.last_message_id,
+    "last_message": Conversation.last_message,
+    "last_timestamp": Conversation.last_timestamp,
+    "unread_count": Conversation.unread_count,
+    "last_read_message_id": Conversation.last_read_message_id,
+})
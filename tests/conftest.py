@@ -0,0 +1,31 @@
+import pytest
+from flask_jwt_extended import create_access_token
+from app import create_app
+from models import db
+
+
+# A fresh app with an empty in-memory database for every test
+@pytest.fixture
+def app():
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# auth(user_id) gives the headers of a logged in request
+@pytest.fixture
+def auth(app):
+    def headers(user_id):
+        return {"Authorization": f"Bearer {create_access_token(identity=str(user_id))}"}
+    return headers
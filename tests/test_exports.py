@@ -0,0 +1,38 @@
+import json
+import pytest
+from models import db, User, Message
+
+
+@pytest.fixture(autouse=True)
+def messages(app):
+    app.config['ADMIN_USERNAMES'] = frozenset({"admin"})
+
+    db.session.add_all([User(username="admin"), User(username="b")])
+    db.session.add_all([Message(message=f"m{i}", sender=1, receiver=2) for i in range(5)])
+    db.session.commit()
+
+
+def export(client, auth, query=""):
+    return client.get(f"/admin/export/messages{query}", headers=auth(1))
+
+
+def ids(response):
+    return [json.loads(line)["id"] for line in response.data.splitlines()]
+
+
+def test_export_resumes_after_id(client, auth):
+    assert ids(export(client, auth)) == [1, 2, 3, 4, 5]
+    assert ids(export(client, auth, "?after_id=3")) == [4, 5]
+
+
+@pytest.mark.parametrize("after_id", ["abc", "-1", "1.5", ""])
+def test_invalid_after_id_is_rejected(client, auth, after_id):
+    response = export(client, auth, f"?after_id={after_id}")
+
+    assert response.status_code == 400
+    assert "after_id" in response.json["error"]
+
+
+def test_export_is_admin_only(client, auth):
+    assert export(client, auth).status_code == 200
+    assert client.get("/admin/export/messages", headers=auth(2)).status_code == 403
@@ -0,0 +1,68 @@
+import pytest
+from geo import GridIndex, normalize_location, haversine_km
+from models import db, User, MoreDetail
+
+NAIROBI = normalize_location("Nairobi")
+
+
+def test_grid_query_filters_by_radius_and_sorts_by_distance():
+    grid = GridIndex()
+    for key, town in enumerate(["Mombasa", "Thika", "Nairobi", "Kiambu"]):
+        grid.add(key, *normalize_location(town))
+
+    results = grid.query(*NAIROBI, 50)
+
+    assert [key for key, _ in results] == [2, 3, 1]
+    assert [distance for _, distance in results] == sorted(distance for _, distance in results)
+    assert all(distance <= 50 for _, distance in results)
+
+
+def test_grid_add_moves_an_existing_key():
+    grid = GridIndex()
+    grid.add("a", *normalize_location("Mombasa"))
+    grid.add("a", *NAIROBI)
+
+    assert len(grid) == 1
+    assert grid.query(*normalize_location("Mombasa"), 50) == []
+    assert grid.query(*NAIROBI, 1) == [("a", 0.0)]
+
+
+@pytest.fixture(autouse=True)
+def providers(app):
+    for name, town, role in [("nairobi", "Nairobi", "Worker"), ("thika", "Thika", "Worker"),
+                             ("mombasa", "Mombasa", "Worker"), ("client", "Nairobi", "Client")]:
+        user = User(username=name, display_name=name.title(), role=role)
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(MoreDetail(user_id=user.id, location=town, latitude=normalize_location(town)[0],
+                                  longitude=normalize_location(town)[1]))
+    db.session.commit()
+
+
+def near(client, query):
+    response = client.get(f"/serviceproviders?fields=username&{query}")
+    assert response.status_code == 200
+    return [(provider["username"], provider["distance_km"]) for provider in response.json]
+
+
+def test_near_query_returns_workers_in_radius_nearest_first(client):
+    thika = round(haversine_km(*NAIROBI, *normalize_location("Thika")), 2)
+
+    assert near(client, "near=Nairobi&radius=50") == [("nairobi", 0.0), ("thika", thika)]
+    assert [name for name, _ in near(client, "near=Mombasa&radius=1000")] == ["mombasa", "nairobi", "thika"]
+
+
+def test_patch_moves_a_provider(client):
+    response = client.patch("/details/3", json={"location": "Nairobi"})
+    assert response.status_code == 200
+
+    assert sorted(near(client, "near=Nairobi&radius=5")) == [("mombasa", 0.0), ("nairobi", 0.0)]
+    assert near(client, "near=Mombasa&radius=50") == []
+
+
+@pytest.mark.parametrize("radius", ["inf", "-inf", "nan", "-5", "0", "1001", "abc"])
+def test_invalid_radius_is_rejected(client, radius):
+    response = client.get(f"/serviceproviders?near=Nairobi&radius={radius}")
+
+    assert response.status_code == 400
+    assert "Invalid radius" in response.json["error"]
@@ -0,0 +1,45 @@
+import pytest
+from models import db, User
+
+
+@pytest.fixture(autouse=True)
+def users(app):
+    db.session.add_all([User(username=name, display_name=name.upper()) for name in "abcd"])
+    db.session.commit()
+
+
+def send(client, auth, sender, receiver, text):
+    response = client.post("/messages/send", json={"message": text, "receiver": receiver}, headers=auth(sender))
+    assert response.status_code == 200
+
+
+def inbox(client, auth, user_id, query=""):
+    response = client.get(f"/inbox{query}", headers=auth(user_id))
+    assert response.status_code == 200
+    return [(row["partner_name"], row["last_message"], row["unread_count"]) for row in response.json]
+
+
+def test_inbox_lists_latest_conversation_first_with_unread_counts(client, auth):
+    send(client, auth, 2, 1, "hi from b")
+    send(client, auth, 3, 1, "hi from c")
+    send(client, auth, 2, 1, "b again")
+    send(client, auth, 1, 4, "hi d")
+
+    assert inbox(client, auth, 1) == [("D", "hi d", 0), ("B", "b again", 2), ("C", "hi from c", 1)]
+
+    assert client.post("/inbox/read", json={"user_id": 2}, headers=auth(1)).status_code == 200
+    assert inbox(client, auth, 1)[1] == ("B", "b again", 0)
+
+
+def test_message_to_yourself_is_not_unread(client, auth):
+    send(client, auth, 1, 1, "note to self")
+
+    assert inbox(client, auth, 1) == [("A", "note to self", 0)]
+
+
+@pytest.mark.parametrize("limit, count", [(-1, 1), (0, 1), (2, 2), (1000, 3)])
+def test_limit_is_clamped(client, auth, limit, count):
+    for sender in (2, 3, 4):
+        send(client, auth, sender, 1, "hi")
+
+    assert len(inbox(client, auth, 1, f"?limit={limit}")) == count
@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from models import db, User, MoreDetail, Message, Job, DeadLetterJob
+from jobs import Worker, requeue_stale_jobs
+
+
+# Stands in for the OpenAI client in app.extensions['llm']. Each call pops the next outcome:
+# a string is returned as the reply, an exception is raised.
+class FakeLLM:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=outcome))])
+
+
+@pytest.fixture(autouse=True)
+def users(app):
+    app.config.update(JOB_MAX_ATTEMPTS=2, JOB_BASE_BACKOFF=2)
+
+    db.session.add_all([
+        User(username="client", display_name="Client", role="Client"),
+        User(username="plumber", display_name="Plumber", role="Worker"),
+        User(username="someone", display_name="Someone", role="Client"),
+    ])
+    db.session.add(MoreDetail(user_id=2, jobTitle="Plumber"))
+    db.session.commit()
+
+
+def send_chat(client, auth, message="How much for a leaking tap?"):
+    response = client.post("/chat/send?user_id=2", json={"message": message}, headers=auth(1))
+    assert response.status_code == 202
+    return response.json["job_id"]
+
+
+# Makes a job waiting out its backoff due now
+def make_due(job_id):
+    job = db.session.get(Job, job_id)
+    job.run_at = datetime.utcnow()
+    db.session.commit()
+
+
+def test_chat_reply_is_saved(app, client, auth):
+    app.extensions['llm'] = FakeLLM("A new washer is 500, labour 1000. Total 1500.")
+    job_id = send_chat(client, auth)
+
+    assert Worker(app).run_once("test") is True
+
+    response = client.get(f"/jobs/{job_id}", headers=auth(1))
+    assert response.status_code == 200
+    assert response.json["status"] == "done"
+    assert response.json["attempts"] == 1
+    assert response.json["result"]["ai_response"]["message"] == "A new washer is 500, labour 1000. Total 1500."
+
+    reply = db.session.get(Message, response.json["result"]["ai_response"]["id"])
+    assert (reply.sender, reply.receiver) == (2, 1)
+
+
+def test_failed_attempt_is_retried_after_backoff(app, client, auth):
+    app.extensions['llm'] = FakeLLM(TimeoutError("LLM timed out"), "Sorry for the wait, it is 1500.")
+    job_id = send_chat(client, auth)
+    worker = Worker(app)
+
+    before = datetime.utcnow()
+    assert worker.run_once("test") is True
+
+    job = db.session.get(Job, job_id)
+    assert job.status == 'queued'
+    assert job.attempts == 1
+    assert "LLM timed out" in job.last_error
+    assert job.run_at >= before + timedelta(seconds=2)
+
+    # Not due until the backoff has passed
+    assert worker.run_once("test") is False
+
+    make_due(job_id)
+    assert worker.run_once("test") is True
+
+    job = db.session.get(Job, job_id)
+    assert job.status == 'done'
+    assert job.attempts == 2
+    assert job.last_error is None
+
+
+def test_job_is_dead_lettered_after_max_attempts(app, client, auth):
+    app.extensions['llm'] = FakeLLM(RuntimeError("down"), RuntimeError("still down"))
+    job_id = send_chat(client, auth)
+    worker = Worker(app)
+
+    worker.run_once("test")
+    make_due(job_id)
+    worker.run_once("test")
+
+    job = db.session.get(Job, job_id)
+    assert job.status == 'failed'
+    assert job.attempts == 2
+
+    dead = DeadLetterJob.query.filter_by(job_id=job_id).one()
+    assert dead.attempts == 2
+    assert "still down" in dead.error
+
+    # Nothing left to run
+    assert worker.run_once("test") is False
+
+
+def test_stale_job_on_its_last_attempt_is_dead_lettered(app, client, auth):
+    job_id = send_chat(client, auth)
+
+    job = db.session.get(Job, job_id)
+    job.status, job.attempts, job.locked_by = 'running', 2, "gone:1:0"
+    job.started_at = datetime.utcnow() - timedelta(hours=1)
+    db.session.commit()
+
+    assert requeue_stale_jobs(timeout=300) == 1
+
+    job = db.session.get(Job, job_id)
+    assert job.status == 'failed'
+    assert DeadLetterJob.query.filter_by(job_id=job_id).count() == 1
+
+
+def test_retry_after_saved_reply_does_not_write_it_again(app, client, auth):
+    app.extensions['llm'] = llm = FakeLLM("It is 1500.")
+    job_id = send_chat(client, auth)
+    worker = Worker(app)
+
+    worker.run_once("test")
+
+    # As if the worker died after committing the reply, before the job was marked done
+    job = db.session.get(Job, job_id)
+    job.status = 'queued'
+    db.session.commit()
+
+    worker.run_once("test")
+
+    assert llm.calls == 1
+    assert Message.query.filter_by(sender=2, receiver=1).count() == 1
+    assert db.session.get(Job, job_id).status == 'done'
+
+
+def test_job_status_is_only_visible_to_its_owner(app, client, auth):
+    job_id = send_chat(client, auth)
+
+    assert client.get(f"/jobs/{job_id}", headers=auth(1)).status_code == 200
+    assert client.get(f"/jobs/{job_id}", headers=auth(3)).status_code == 404
+    assert client.get(f"/jobs/{job_id}").status_code == 401
+    assert client.get(f"/jobs/{job_id + 1}", headers=auth(1)).status_code == 404
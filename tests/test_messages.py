@@ -0,0 +1,51 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from archive import archive_messages
+from models import db, User, Message
+
+
+@pytest.fixture(autouse=True)
+def conversation(app):
+    app.config['ADMIN_USERNAMES'] = frozenset({"a"})
+
+    db.session.add_all([User(username="a", display_name="A"), User(username="b", display_name="B")])
+    old = datetime.utcnow() - timedelta(days=400)
+    for i in range(10):
+        db.session.add(Message(
+            message=f"m{i}", sender=1 + i % 2, receiver=2 - i % 2,
+            timestamp=old + timedelta(days=i) if i < 8 else datetime.utcnow()
+        ))
+    db.session.commit()
+
+    # m0..m7 are moved to messages_archive, m8 and m9 stay live
+    assert archive_messages(older_than_days=180) == 8
+
+
+def texts(response):
+    assert response.status_code == 200
+    return [message["message"] for message in response.json]
+
+
+def test_unpaged_history_includes_archived_messages(client, auth):
+    assert texts(client.get("/messages?user_id=2", headers=auth(1))) == [f"m{i}" for i in range(10)]
+
+
+def test_paging_crosses_into_the_archive(client, auth):
+    assert texts(client.get("/messages?user_id=2&limit=3", headers=auth(1))) == ["m7", "m8", "m9"]
+    assert texts(client.get("/messages?user_id=2&limit=3&before=8", headers=auth(1))) == ["m4", "m5", "m6"]
+
+
+# A negative LIMIT means "no limit" on SQLite and is an error on PostgreSQL, so it is raised to 1
+@pytest.mark.parametrize("limit, count", [(-1, 1), (1, 1), (1000, 10)])
+def test_limit_is_clamped(client, auth, limit, count):
+    assert texts(client.get(f"/messages?user_id=2&limit={limit}", headers=auth(1)))[-1] == "m9"
+    assert len(texts(client.get(f"/messages?user_id=2&limit={limit}", headers=auth(1)))) == count
+
+
+def test_export_includes_archived_messages(client, auth):
+    response = client.get("/admin/export/messages", headers=auth(1))
+    assert [json.loads(line)["message"] for line in response.data.splitlines()] == [f"m{i}" for i in range(10)]
+
+    response = client.get("/admin/export/messages?format=csv&after_id=6", headers=auth(1))
+    assert [line.split(",")[0] for line in response.data.decode().splitlines()] == ["id", "7", "8", "9", "10"]
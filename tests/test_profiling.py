@@ -0,0 +1,66 @@
+import cProfile
+import os
+import pytest
+from models import db, User
+
+
+@pytest.fixture(autouse=True)
+def admin(app, tmp_path):
+    app.config['ADMIN_USERNAMES'] = frozenset({"admin"})
+    app.extensions['profiler'].output_dir = str(tmp_path)
+
+    db.session.add(User(username="admin"))
+    db.session.commit()
+
+
+def profiles(tmp_path):
+    directory = tmp_path / "serviceproviders"
+    return sorted(os.listdir(directory)) if directory.is_dir() else []
+
+
+def test_enabling_through_patch_writes_profiles(client, auth, tmp_path):
+    client.get("/serviceproviders")
+    assert profiles(tmp_path) == []
+
+    response = client.patch("/admin/profiling", json={"enabled": True, "sample_rate": 1}, headers=auth(1))
+    assert response.status_code == 200
+    assert response.json == {"enabled": True, "sample_rate": 1.0, "engine": "cprofile"}
+
+    assert client.get("/serviceproviders").status_code == 200
+    assert len(profiles(tmp_path)) == 1
+    assert profiles(tmp_path)[0].endswith(".prof")
+
+    client.patch("/admin/profiling", json={"enabled": False}, headers=auth(1))
+    client.get("/serviceproviders")
+    assert len(profiles(tmp_path)) == 1
+
+
+def test_signed_header_profiles_a_single_request(client, auth, tmp_path):
+    client.patch("/admin/profiling", json={"enabled": True, "sample_rate": 0}, headers=auth(1))
+    token = client.post("/admin/profiling", headers=auth(1)).json
+
+    client.get("/serviceproviders")
+    client.get("/serviceproviders", headers={token["header"]: token["token"]})
+    client.get("/serviceproviders", headers={token["header"]: "forged"})
+
+    assert len(profiles(tmp_path)) == 1
+
+
+@pytest.mark.parametrize("body", [{"enabled": "false"}, {"enabled": 1}, {"sample_rate": True}, {"sample_rate": "0.5"}, {"sample_rate": 2}])
+def test_invalid_settings_are_rejected(client, auth, body):
+    response = client.patch("/admin/profiling", json=body, headers=auth(1))
+
+    assert response.status_code == 400
+    assert client.get("/admin/profiling", headers=auth(1)).json["settings"]["enabled"] is False
+
+
+# Python 3.12+ refuses a second active cProfile session; the request must still succeed, just unprofiled
+def test_request_succeeds_when_the_profiler_cannot_start(client, auth, tmp_path, monkeypatch):
+    client.patch("/admin/profiling", json={"enabled": True, "sample_rate": 1}, headers=auth(1))
+
+    def busy(self):
+        raise ValueError("Another profiling tool is already active")
+    monkeypatch.setattr(cProfile.Profile, "enable", busy)
+
+    assert client.get("/serviceproviders").status_code == 200
+    assert profiles(tmp_path) == []
@@ -0,0 +1,86 @@
+import pytest
+from werkzeug.security import generate_password_hash
+from models import db, User
+from ratelimit import MemoryBucketStore, limiter, parse_limit
+
+
+def test_bucket_refills_at_the_limit_rate():
+    store = MemoryBucketStore()
+    capacity, rate = parse_limit("2/minute")
+
+    assert store.take("k", capacity, rate, now=0)[0] is True
+    assert store.take("k", capacity, rate, now=0)[0] is True
+    assert store.take("k", capacity, rate, now=0)[0] is False
+    # One token comes back every 30 seconds
+    assert store.take("k", capacity, rate, now=29)[0] is False
+    assert store.take("k", capacity, rate, now=60)[0] is True
+
+
+def test_store_evicts_least_recently_used_buckets():
+    store = MemoryBucketStore(max_keys=3)
+
+    for key in ["a", "b", "c"]:
+        store.take(key, 1, 1, now=0)
+    store.take("a", 1, 1, now=1)
+    for key in ["d", "e"]:
+        store.take(key, 1, 1, now=2)
+
+    assert list(store.buckets) == ["a", "d", "e"]
+
+    for i in range(1000):
+        store.take(f"ip:{i}", 1, 1, now=3)
+    assert len(store.buckets) == 3
+
+
+@pytest.fixture(autouse=True)
+def limits(app):
+    app.config.update(RATELIMIT_ENABLED=True, RATELIMITS={"login": "2/minute", "send_message": "2/minute"})
+
+    db.session.add_all([
+        User(username="a", password=generate_password_hash("secret")),
+        User(username="b", password=generate_password_hash("secret")),
+    ])
+    db.session.commit()
+
+
+def login(client, ip="10.0.0.1"):
+    return client.post("/login", json={"username": "a", "password": "secret"}, environ_base={"REMOTE_ADDR": ip})
+
+
+def test_throttled_request_gets_429_with_retry_after(client):
+    assert login(client).status_code == 200
+    assert login(client).status_code == 200
+
+    response = login(client)
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 30
+
+
+def test_anonymous_callers_are_limited_per_ip(client):
+    login(client, "10.0.0.1")
+    login(client, "10.0.0.1")
+
+    assert login(client, "10.0.0.1").status_code == 429
+    assert login(client, "10.0.0.2").status_code == 200
+
+
+def test_logged_in_callers_are_limited_per_user(client, auth):
+    def send(user_id):
+        return client.post("/messages/send", json={"message": "hi", "receiver": 2}, headers=auth(user_id))
+
+    assert send(1).status_code == 200
+    assert send(1).status_code == 200
+    assert send(1).status_code == 429
+    # Same address, different user
+    assert send(2).status_code == 200
+
+
+def test_stats_count_allowed_and_throttled(app, client):
+    for _ in range(3):
+        login(client)
+
+    with app.test_request_context():
+        stats = limiter.stats()
+
+    assert stats["limits"]["login"] == {"allowed": 2, "throttled": 1}
+    assert stats["throttled"] == [{"limit": "login", "key": "ip:10.0.0.1", "count": 1}]
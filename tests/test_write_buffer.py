@@ -0,0 +1,114 @@
+import threading
+import pytest
+from sqlalchemy.exc import IntegrityError
+from app import create_app
+from config import TestingConfig
+from models import db, User, Message
+from write_buffer import message_buffer
+
+
+# The writer thread needs its own connection, so these tests use a SQLite file instead of the in-memory database
+@pytest.fixture
+def app(tmp_path):
+    class Config(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        MESSAGE_WRITE_COALESCING = True
+        MESSAGE_WRITE_INTERVAL_MS = 200
+
+    app = create_app(Config)
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([User(username="a"), User(username="b")])
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def inserts(monkeypatch):
+    calls = []
+    insert = message_buffer._insert
+
+    def recording(rows):
+        calls.append([row["message"] for row in rows])
+        return insert(rows)
+
+    monkeypatch.setattr(message_buffer, "_insert", recording)
+    return calls
+
+
+# Runs each write on its own thread, like concurrent requests, and returns the results (or exceptions) in order
+def write_concurrently(app, *messages):
+    results = [None] * len(messages)
+
+    def write(index, message, receiver):
+        with app.app_context():
+            try:
+                results[index] = message_buffer.write(message=message, sender=1, receiver=receiver)
+            except Exception as e:
+                results[index] = e
+
+    threads = [threading.Thread(target=write, args=(index, *message)) for index, message in enumerate(messages)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def saved():
+    db.session.expire_all()
+    return sorted(message for message, in db.session.query(Message.message))
+
+
+def test_concurrent_writes_share_one_insert(app, inserts):
+    results = write_concurrently(app, *[(f"m{i}", 2) for i in range(5)])
+
+    assert len(inserts) == 1
+    assert sorted(inserts[0]) == [f"m{i}" for i in range(5)]
+    assert sorted(result["message"] for result in results) == saved()
+    assert len({result["id"] for result in results}) == 5
+
+
+def test_bad_row_only_fails_its_own_request(app, inserts):
+    good, bad = write_concurrently(app, ("good", 2), ("bad", None))
+
+    # The batch fails as a whole, then every request is retried on its own
+    assert len(inserts) == 3
+    assert good["message"] == "good"
+    assert isinstance(bad, IntegrityError)
+    assert saved() == ["good"]
+
+
+def test_timed_out_write_is_cancelled_unless_already_claimed(app, monkeypatch):
+    app.config['MESSAGE_WRITE_TIMEOUT'] = 0.2
+    entered, release = threading.Event(), threading.Event()
+    insert = message_buffer._insert
+
+    def slow(rows):
+        if rows[0]["message"] == "first":
+            entered.set()
+            release.wait(5)
+        return insert(rows)
+
+    monkeypatch.setattr(message_buffer, "_insert", slow)
+
+    # "first" is claimed by the writer thread and stuck in its INSERT past the timeout
+    first = threading.Thread(target=write_concurrently, args=(app, ("first", 2)))
+    first.start()
+    assert entered.wait(5)
+
+    # "second" is still queued when it times out, so it is cancelled and never written
+    with pytest.raises(TimeoutError):
+        message_buffer.write(message="second", sender=1, receiver=2)
+
+    release.set()
+    first.join()
+
+    assert message_buffer.write(message="third", sender=1, receiver=2)["message"] == "third"
+    assert saved() == ["first", "third"]
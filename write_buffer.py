@@ -0,0 +1,197 @@
+from datetime import datetime
+import os
+import queue
+import threading
+import time
+from flask import current_app
+from sqlalchemy import insert
+from models import db, Message
+from inbox import record_messages
+
+
+# One request's rows waiting in the queue. A request that times out cancels its write, but only while the
+# worker hasn't claimed it for a batch yet; once claimed, the rows may already be committed.
+class PendingWrite:
+    def __init__(self, rows):
+        self.rows = rows
+        self.ids = None
+        self.error = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.claimed = False
+        self.cancelled = False
+
+    def claim(self):
+        with self.lock:
+            if not self.cancelled:
+                self.claimed = True
+            return self.claimed
+
+    def cancel(self):
+        with self.lock:
+            if not self.claimed:
+                self.cancelled = True
+            return self.cancelled
+
+
+# Per-app state: every app gets its own queue and writer thread
+class _BufferState:
+    def __init__(self, app):
+        self.app = app
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+
+# This class groups message inserts coming from many requests into one multi-row INSERT and a single commit.
+# A background thread collects writes for MESSAGE_WRITE_INTERVAL_MS (or until MESSAGE_WRITE_MAX_BATCH rows),
+# writes them in one transaction, and only then wakes the waiting requests, so each request still gets its
+# response after its own message is durably committed.
+# It is off unless MESSAGE_WRITE_COALESCING is set, in which case writes go straight through the session as before.
+# The object itself holds no app state, so one instance can serve several apps (e.g. one per test).
+class MessageWriteBuffer:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MESSAGE_WRITE_COALESCING', False)
+        app.config.setdefault('MESSAGE_WRITE_INTERVAL_MS', 5)
+        app.config.setdefault('MESSAGE_WRITE_MAX_BATCH', 500)
+        app.config.setdefault('MESSAGE_WRITE_TIMEOUT', 10)
+
+        app.extensions['message_write_buffer'] = _BufferState(app)
+
+    # Writes messages and returns them as dicts (like Message.to_dict) once they are committed.
+    # Each row is a dict with message, sender and receiver.
+    def write_many(self, rows):
+        now = datetime.utcnow()
+        rows = [dict(row, timestamp=row.get('timestamp') or now) for row in rows]
+
+        if not current_app.config['MESSAGE_WRITE_COALESCING']:
+            return self._write_direct(rows)
+
+        pending = PendingWrite(rows)
+        self._ensure_worker().put(pending)
+
+        if not pending.done.wait(current_app.config['MESSAGE_WRITE_TIMEOUT']):
+            if pending.cancel():
+                raise TimeoutError("Timed out waiting for the message to be saved")
+            # Too late to cancel, the batch holding these rows is being written, so wait for its outcome
+            pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+
+        return [self._as_dict(row, id) for row, id in zip(rows, pending.ids)]
+
+    def write(self, message, sender, receiver):
+        return self.write_many([{"message": message, "sender": sender, "receiver": receiver}])[0]
+
+    def _as_dict(self, row, id):
+        return {
+            'id': id,
+            'message': row['message'],
+            'receiver': row['receiver'],
+            'sender': row['sender']
+        }
+
+    def _write_direct(self, rows):
+        messages = [Message(**row) for row in rows]
+
+        try:
+            db.session.add_all(messages)
+            db.session.flush()
+            record_messages([dict(row, id=message.id) for row, message in zip(rows, messages)])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return [message.to_dict() for message in messages]
+
+    # The worker thread is started lazily, and again after a fork, since threads don't survive into gunicorn workers
+    def _ensure_worker(self):
+        state = current_app.extensions['message_write_buffer']
+
+        with state.lock:
+            if state.pid != os.getpid() or state.thread is None or not state.thread.is_alive():
+                state.queue = queue.Queue()
+                state.pid = os.getpid()
+                state.thread = threading.Thread(
+                    target=self._run, args=(state.app, state.queue), name="message-write-buffer", daemon=True
+                )
+                state.thread.start()
+            return state.queue
+
+    def _run(self, app, pending_queue):
+        interval = app.config['MESSAGE_WRITE_INTERVAL_MS'] / 1000
+        max_batch = app.config['MESSAGE_WRITE_MAX_BATCH']
+
+        while True:
+            pending = pending_queue.get()
+            if not pending.claim():
+                continue
+
+            batch = [pending]
+            size = len(pending.rows)
+            deadline = time.monotonic() + interval
+
+            while size < max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = pending_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if not pending.claim():
+                    continue
+                batch.append(pending)
+                size += len(pending.rows)
+
+            # Nothing may escape here: the thread would die and leave every request in the batch waiting
+            try:
+                with app.app_context():
+                    self._flush(batch)
+            except Exception as e:
+                for pending in batch:
+                    if not pending.done.is_set():
+                        pending.error = e
+                        pending.done.set()
+
+    # Inserts the rows and updates the inbox summaries in the same transaction
+    def _insert(self, rows):
+        ids = db.session.scalars(
+            insert(Message).returning(Message.id, sort_by_parameter_order=True),
+            rows
+        ).all()
+        record_messages([dict(row, id=id) for row, id in zip(rows, ids)])
+
+        return ids
+
+    def _flush(self, batch):
+        try:
+            ids = self._insert([row for pending in batch for row in pending.rows])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # One bad row shouldn't fail everyone else's writes, so retry each request on its own
+            for pending in batch:
+                try:
+                    pending.ids = self._insert(pending.rows)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    pending.error = e
+                pending.done.set()
+            return
+
+        start = 0
+        for pending in batch:
+            pending.ids = ids[start:start + len(pending.rows)]
+            start += len(pending.rows)
+            pending.done.set()
+
+
+message_buffer = MessageWriteBuffer()